@@ -1,19 +1,26 @@
 import os
-from flask import Flask, send_from_directory, request, session
+import time
+from flask import Flask, send_from_directory
 from flask_wtf.csrf import CSRFProtect
 from flask_migrate import Migrate
 from flask_login import LoginManager
-from models import db, Event, User
-from werkzeug.security import generate_password_hash
+from models import db
+from commands import init_commands, init_db
+from cache import events_cache
+from auth import PublicReadSessionInterface, user_cache
+from snapshots import embed_snapshots
+from instrumentation import instrumentation
+from query_profiler import query_profiler
 import logging
 
 csrf = CSRFProtect()
 migrate = Migrate()
 login_manager = LoginManager()
 
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
 
 def create_app():
+    started = time.perf_counter()
     app = Flask(__name__)
     app.secret_key = os.environ.get("FLASK_SECRET_KEY") or "a secret key"
     app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
@@ -21,55 +28,84 @@ def create_app():
         "pool_recycle": 300,
         "pool_pre_ping": True,
     }
+    # gunicorn.conf.py sizes the pool to the worker's concurrency
+    if os.environ.get("DB_POOL_SIZE"):
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"].update({
+            "pool_size": int(os.environ["DB_POOL_SIZE"]),
+            "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 0)),
+            "pool_timeout": int(os.environ.get("DB_POOL_TIMEOUT", 10)),
+        })
     app.config['WTF_CSRF_TIME_LIMIT'] = None  # Disable CSRF token expiration
     app.config['WTF_CSRF_SSL_STRICT'] = False  # Disable SSL requirement for CSRF
+    # 'virtual' stores only the series rule, 'materialize' writes one row per occurrence
+    app.config['RECURRENCE_MODE'] = os.environ.get("RECURRENCE_MODE", "virtual")
+    # Serve /events from the event_occurrences day index instead of expanding series per request
+    app.config['OCCURRENCE_INDEX'] = os.environ.get("OCCURRENCE_INDEX", "false").lower() == "true"
+    # Seconds anonymous clients and proxies may reuse /events and /child_embed responses
+    app.config['EVENTS_MAX_AGE'] = int(os.environ.get("EVENTS_MAX_AGE", 60))
+    app.config['EMBED_MAX_AGE'] = int(os.environ.get("EMBED_MAX_AGE", 300))
+    app.config['EVENTS_MAX_MONTHS'] = int(os.environ.get("EVENTS_MAX_MONTHS", 12))
+    app.config['MANAGE_EVENTS_PAGE_SIZE'] = int(os.environ.get("MANAGE_EVENTS_PAGE_SIZE", 50))
+    # Rows validated, deduplicated and inserted per transaction by the CSV/ICS import
+    app.config['IMPORT_BATCH_SIZE'] = int(os.environ.get("IMPORT_BATCH_SIZE", 500))
+    # Zone the calendar's times are in, imported UTC and TZID times are converted to it
+    app.config['IMPORT_TIMEZONE'] = os.environ.get("IMPORT_TIMEZONE", "Europe/Berlin")
+    # Uploads wait here until the import job has read them, must be shared with `flask jobs worker`
+    app.config['IMPORT_UPLOAD_DIR'] = os.environ.get("IMPORT_UPLOAD_DIR") or os.path.join(app.instance_path, 'uploads')
+    # 'inline' runs series expansion, bulk deletes and imports in the request, 'queue' leaves them to `flask jobs worker`
+    app.config['JOBS_MODE'] = os.environ.get("JOBS_MODE", "inline")
+    # Seconds an idle worker waits before looking for new jobs again
+    app.config['JOBS_POLL_INTERVAL'] = float(os.environ.get("JOBS_POLL_INTERVAL", 1.0))
+    # Pre-render the embed widget's months as static pages, refreshed after every write
+    app.config['EMBED_SNAPSHOTS'] = os.environ.get("EMBED_SNAPSHOTS", "false").lower() == "true"
+    app.config['EMBED_SNAPSHOT_DIR'] = os.environ.get("EMBED_SNAPSHOT_DIR") or os.path.join(app.instance_path, 'embed_snapshots')
+    # Months before and from the current month on that get a snapshot
+    app.config['EMBED_SNAPSHOT_MONTHS_BACK'] = int(os.environ.get("EMBED_SNAPSHOT_MONTHS_BACK", 3))
+    app.config['EMBED_SNAPSHOT_MONTHS'] = int(os.environ.get("EMBED_SNAPSHOT_MONTHS", 12))
+    app.config['EMBED_SNAPSHOT_MAX_AGE'] = int(os.environ.get("EMBED_SNAPSHOT_MAX_AGE", 3600))
+    # Anonymous GETs below these paths get no session, see auth.PublicReadSessionInterface
+    app.config['SESSIONLESS_PATHS'] = ('/events', '/child_embed', '/embed/snapshot')
+    # Development convenience only, production runs `flask init-db` once per deploy
+    app.config['AUTO_INIT_DB'] = os.environ.get("AUTO_INIT_DB", "false").lower() == "true"
 
     db.init_app(app)
     csrf.init_app(app)
     migrate.init_app(app, db)
+    events_cache.init_app(app)
+    user_cache.init_app(app)
+    embed_snapshots.init_app(app)
+    app.session_interface = PublicReadSessionInterface()
+    instrumentation.init_app(app)
+    query_profiler.init_app(app)
     login_manager.init_app(app)
     login_manager.login_view = 'login'
 
-    @app.before_request
-    def log_request_info():
-        logging.debug('Headers: %s', request.headers)
-        logging.debug('CSRF Token from form: %s', request.form.get('csrf_token'))
-        logging.debug('CSRF Token from session: %s', session.get('csrf_token'))
-
-    @app.after_request
-    def log_response_info(response):
-        logging.debug('Response Status: %s', response.status)
-        logging.debug('Response Headers: %s', response.headers)
-        return response
-
-    with app.app_context():
-        db.create_all()
-        if not User.query.filter_by(username='admin').first():
-            admin_user = User(username='admin', password=generate_password_hash('admin'))
-            db.session.add(admin_user)
-            db.session.commit()
-
     from routes import init_routes
     init_routes(app)
+    init_commands(app)
 
     @app.route('/node_modules/<path:filename>')
     def serve_node_modules(filename):
         node_modules_path = os.path.join(app.root_path, 'node_modules')
         return send_from_directory(node_modules_path, filename)
 
-    app.logger.info(f"FLASK_SECRET_KEY is {'set' if os.environ.get('FLASK_SECRET_KEY') else 'not set'}")
-    app.logger.info(f"DATABASE_URL is {'set' if os.environ.get('DATABASE_URL') else 'not set'}")
-    app.logger.info(f"PGPORT is {'set' if os.environ.get('PGPORT') else 'not set'}")
-    app.logger.info(f"PGUSER is {'set' if os.environ.get('PGUSER') else 'not set'}")
-    app.logger.info(f"PGPASSWORD is {'set' if os.environ.get('PGPASSWORD') else 'not set'}")
-    app.logger.info(f"PGDATABASE is {'set' if os.environ.get('PGDATABASE') else 'not set'}")
-    app.logger.info(f"PGHOST is {'set' if os.environ.get('PGHOST') else 'not set'}")
+    app.logger.debug("Environment: %s", ", ".join(
+        f"{name} {'set' if os.environ.get(name) else 'not set'}"
+        for name in ("FLASK_SECRET_KEY", "DATABASE_URL", "PGPORT", "PGUSER", "PGPASSWORD", "PGDATABASE", "PGHOST")
+    ))
+
+    # Schema and admin user are handled by `flask init-db`, workers boot without touching the database
+    if app.config['AUTO_INIT_DB']:
+        with app.app_context():
+            init_db()
 
+    instrumentation.record_startup(time.perf_counter() - started)
+    app.logger.info("App created in %.1f ms", (time.perf_counter() - started) * 1000)
     return app
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.get(int(user_id))
 
 if __name__ == "__main__":
     app = create_app()
@@ -0,0 +1,97 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask.sessions import SecureCookieSessionInterface
+from sqlalchemy.orm import make_transient_to_detached
+from models import db, User
+
+
+class UserCache:
+    """Detached copies of User rows for Flask-Login's user_loader, an LRU with a TTL per worker.
+
+    Logged-in requests get the user merged into their session without a query. Call
+    invalidate() after changing a user, other workers pick up the change within the TTL.
+    """
+
+    def __init__(self, app=None):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.max_entries = 0
+        self.ttl = 0
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # 0 turns the cache off
+        app.config.setdefault('USER_CACHE_SIZE', int(os.environ.get('USER_CACHE_SIZE', 128)))
+        app.config.setdefault('USER_CACHE_TTL', int(os.environ.get('USER_CACHE_TTL', 60)))
+        self.max_entries = app.config['USER_CACHE_SIZE']
+        self.ttl = app.config['USER_CACHE_TTL']
+        app.extensions['user_cache'] = self
+
+    def lookup(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+            user, stored_at = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self.entries[user_id]
+                return None
+            self.entries.move_to_end(user_id)
+            return user
+
+    def store(self, user):
+        # A copy outside any session, the request's own instance is expired by its commits
+        copy = User(**{attribute.key: getattr(user, attribute.key) for attribute in db.inspect(User).column_attrs})
+        make_transient_to_detached(copy)
+        with self.lock:
+            self.entries[user.id] = (copy, time.monotonic())
+            self.entries.move_to_end(user.id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get(self, user_id):
+        """Return the user attached to the current session, None if it does not exist."""
+        if not self.max_entries or not self.ttl:
+            return db.session.get(User, user_id)
+        cached = self.lookup(user_id)
+        if cached is None:
+            self.misses += 1
+            user = db.session.get(User, user_id)
+            if user is not None:
+                self.store(user)
+            return user
+        self.hits += 1
+        # load=False copies the cached state into the session without a SELECT
+        return db.session.merge(cached, load=False)
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries)}
+
+
+class PublicReadSessionInterface(SecureCookieSessionInterface):
+    """Hand anonymous GET requests to the public read endpoints a null session.
+
+    Nothing is decoded or written, and the responses go out without Vary: Cookie,
+    so shared caches can keep them. Requests carrying a session or remember cookie
+    still get a real session.
+    """
+
+    def open_session(self, app, request):
+        if (request.method in ('GET', 'HEAD')
+                and request.path.startswith(app.config['SESSIONLESS_PATHS'])
+                and app.config['SESSION_COOKIE_NAME'] not in request.cookies
+                and app.config.get('REMEMBER_COOKIE_NAME', 'remember_token') not in request.cookies):
+            return None
+        return super().open_session(app, request)
+
+
+user_cache = UserCache()
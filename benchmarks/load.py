@@ -0,0 +1,411 @@
+"""Load test: embed viewers and an admin against a real gunicorn server.
+
+Starts gunicorn with the given worker and pool settings for every scenario and
+drives it over HTTP. Simulated embed viewers load /child_embed and then page
+through months with /events/months, the requests child_calendar.js makes.
+Meanwhile an admin adds daily series and bulk deletes events.
+
+    python -m benchmarks.load --database-url postgresql://localhost/calendar_load --reset
+    python -m benchmarks.load --database-url ... --viewers 100 --workers 4 --threads 8 \\
+        --pool-size 8 --max-overflow 4 --scenario mixed --duration 60 --output load.json
+
+Per scenario and request kind it reports p50/p95/p99 latency, error rate and
+throughput. It also reports the peak number of pooled database connections
+each gunicorn worker had checked out, read from /metrics.json, relative to
+pool_size + max_overflow. --reset drops all tables and seeds synthetic data.
+Without it the existing data is used.
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import re
+import secrets
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from datetime import timedelta
+from http.cookiejar import CookieJar
+from urllib.parse import urlencode
+
+from benchmarks.run import SEED_DAYS, SEED_START, git_revision, percentile, reset_database
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMPACT_MIMETYPE = 'application/vnd.kalender.compact+json'
+# Months loaded around the visible one, PREFETCH_MONTHS in child_calendar.js
+PREFETCH_MONTHS = 1
+BLOCK = PREFETCH_MONTHS * 2 + 1
+
+SCENARIOS = {
+    # Embed traffic only
+    'browse': {'admin_interval': None, 'delete_every': 0},
+    # An admin adding a daily series every two seconds, every fifth write is a bulk delete
+    'mixed': {'admin_interval': 2.0, 'delete_every': 5},
+    # The admin writes back to back
+    'write-heavy': {'admin_interval': 0.0, 'delete_every': 3},
+}
+
+
+class Recorder:
+    """Latencies and errors by request kind, shared by all client threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_examples = {}
+
+    def record(self, kind, seconds, error=None):
+        with self.lock:
+            self.samples[kind].append(seconds)
+            if error:
+                self.errors[kind] += 1
+                self.error_examples.setdefault(kind, error)
+
+    def summary(self, seconds):
+        with self.lock:
+            kinds = dict(self.samples)
+            kinds['all'] = [sample for samples in self.samples.values() for sample in samples]
+            errors = dict(self.errors, all=sum(self.errors.values()))
+        return {
+            kind: {
+                'requests': len(samples),
+                'errors': errors.get(kind, 0),
+                'error_rate': errors.get(kind, 0) / len(samples),
+                'p50_ms': percentile(samples, 0.50) * 1000,
+                'p95_ms': percentile(samples, 0.95) * 1000,
+                'p99_ms': percentile(samples, 0.99) * 1000,
+                'max_ms': max(samples) * 1000,
+                'throughput_rps': len(samples) / seconds,
+            }
+            for kind, samples in kinds.items() if samples
+        }
+
+
+def timed_get(connection, path, headers, recorder, kind):
+    started = time.perf_counter()
+    error = None
+    try:
+        connection.request('GET', path, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        if response.status >= 400:
+            error = f'HTTP {response.status}'
+    except (OSError, http.client.HTTPException) as exc:
+        error = type(exc).__name__
+        # The next request opens a fresh connection
+        connection.close()
+    recorder.record(kind, time.perf_counter() - started, error)
+
+
+def viewer(host, port, recorder, stop, seed, args):
+    """One embed visitor after another: page load, first months, prefetch, then a few months forward."""
+    from recurrence import add_months
+    rng = random.Random(seed)
+    connection = http.client.HTTPConnection(host, port, timeout=args.timeout)
+    headers = {'Accept': COMPACT_MIMETYPE, 'Accept-Encoding': 'gzip'}
+
+    def fetch_months(first):
+        timed_get(connection, f"/events/months?start={first.strftime('%Y-%m')}&count={BLOCK}", headers,
+                  recorder, 'events_months')
+
+    while not stop.is_set():
+        month = (SEED_START + timedelta(days=rng.randrange(SEED_DAYS))).replace(day=1)
+        timed_get(connection, '/child_embed', {'Accept-Encoding': 'gzip'}, recorder, 'child_embed')
+        fetch_months(add_months(month, -PREFETCH_MONTHS))
+        fetch_months(add_months(month, 1))
+        fetch_months(add_months(month, -BLOCK))
+        for _ in range(args.navigations):
+            if stop.wait(rng.uniform(0, 2 * args.think_time)):
+                break
+            month = add_months(month, 1)
+            fetch_months(add_months(month, 1))
+        stop.wait(rng.uniform(0, 2 * args.think_time))
+    connection.close()
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Time the write itself, not the page it redirects to
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class AdminSession:
+    """A logged-in admin posting forms with the CSRF token of its session."""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()), NoRedirect())
+        self.csrf_token = None
+
+    def login(self, username, password):
+        page = self.opener.open(self.base_url + '/login', timeout=self.timeout).read().decode('utf-8')
+        self.csrf_token = re.search(r'name="csrf_token"[^>]*value="([^"]+)"', page).group(1)
+        self.post('/login', {'username': username, 'password': password})
+        try:
+            self.opener.open(self.base_url + '/cache_stats', timeout=self.timeout).read()
+        except urllib.error.HTTPError:
+            raise RuntimeError(f'login as {username} failed') from None
+
+    def post(self, path, data):
+        body = urlencode(dict(data, csrf_token=self.csrf_token), doseq=True).encode('utf-8')
+        try:
+            self.opener.open(self.base_url + path, data=body, timeout=self.timeout).read()
+        except urllib.error.HTTPError as response:
+            return None if 300 <= response.code < 400 else f'HTTP {response.code}'
+        except OSError as exc:
+            return type(exc).__name__
+        # Successful writes redirect, a 200 is the form shown again with an error
+        return 'form rejected'
+
+    def timed_post(self, path, data, recorder, kind):
+        started = time.perf_counter()
+        error = self.post(path, data)
+        recorder.record(kind, time.perf_counter() - started, error)
+
+
+def admin(base_url, recorder, stop, seed, deletable_ids, settings, args):
+    rng = random.Random(seed)
+    session = AdminSession(base_url, args.timeout)
+    session.login('admin', args.admin_password)
+    writes = 0
+    while not stop.is_set():
+        writes += 1
+        if settings['delete_every'] and writes % settings['delete_every'] == 0 and len(deletable_ids) >= args.delete_batch:
+            batch = [deletable_ids.pop() for _ in range(args.delete_batch)]
+            session.timed_post('/bulk_delete_events', {'event_ids': [str(event_id) for event_id in batch]},
+                               recorder, 'bulk_delete_events')
+        else:
+            session.timed_post('/add_event', {
+                'name': f'Last täglich {writes}',
+                'date': (SEED_START + timedelta(days=rng.randrange(SEED_DAYS))).isoformat(),
+                'time': '09:00',
+                'category': 'work',
+                'is_recurring': 'y',
+                'recurrence_type': 'daily',
+            }, recorder, 'add_event_daily')
+        stop.wait(settings['admin_interval'])
+
+
+# Generated per run, the started servers accept it for /metrics.json
+METRICS_TOKEN = secrets.token_hex(16)
+
+
+def sample_pools(host, port, stop, pools, interval=0.5):
+    """Keep the latest db_pool figures of every worker that answers /metrics.json."""
+    while not stop.wait(interval):
+        # A new connection per sample, a kept-alive one would always reach the same worker
+        connection = http.client.HTTPConnection(host, port, timeout=5)
+        try:
+            connection.request('GET', '/metrics.json',
+                               headers={'Connection': 'close', 'Authorization': f'Bearer {METRICS_TOKEN}'})
+            snapshot = json.loads(connection.getresponse().read())
+        except (OSError, http.client.HTTPException, ValueError):
+            continue
+        finally:
+            connection.close()
+        pools[snapshot['pid']] = snapshot['db_pool']
+
+
+def pool_summary(pools):
+    if not pools:
+        return {'workers_sampled': 0}
+    capacity = max(pool['size'] + pool['max_overflow'] for pool in pools.values())
+    peak = max(pool['peak_in_use'] for pool in pools.values())
+    return {
+        'workers_sampled': len(pools),
+        'capacity_per_worker': capacity,
+        'peak_in_use': peak,
+        'saturation': peak / capacity if capacity else None,
+        'workers': {str(pid): pool for pid, pool in sorted(pools.items())},
+    }
+
+
+def server_environment(args):
+    env = dict(os.environ, DATABASE_URL=args.database_url, PORT=str(args.port), LOG_LEVEL='WARNING',
+               RECURRENCE_MODE=args.recurrence_mode, EVENTS_CACHE=args.cache,
+               OCCURRENCE_INDEX='true' if args.occurrence_index else 'false',
+               JOBS_MODE='queue' if args.job_workers else 'inline', METRICS_ENABLED='true',
+               METRICS_TOKEN=METRICS_TOKEN)
+    # Unset values fall back to the defaults in gunicorn.conf.py
+    for name, value in (('WEB_CONCURRENCY', args.workers), ('GUNICORN_THREADS', args.threads),
+                        ('GUNICORN_WORKER_CLASS', args.worker_class), ('DB_POOL_SIZE', args.pool_size),
+                        ('DB_MAX_OVERFLOW', args.max_overflow)):
+        if value is not None:
+            env[name] = str(value)
+    return env
+
+
+def start_processes(args, log):
+    env = server_environment(args)
+    processes = [subprocess.Popen([sys.executable, '-m', 'gunicorn', 'app:create_app()'], cwd=ROOT, env=env,
+                                  stdout=log, stderr=subprocess.STDOUT)]
+    for _ in range(args.job_workers):
+        processes.append(subprocess.Popen([sys.executable, '-m', 'flask', '--app', 'app:create_app()', 'jobs', 'worker'],
+                                          cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT))
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if processes[0].poll() is not None:
+            raise RuntimeError(f'gunicorn exited with status {processes[0].returncode}, see {log.name}')
+        try:
+            urllib.request.urlopen(urllib.request.Request(
+                f'http://127.0.0.1:{args.port}/metrics.json', headers={'Authorization': f'Bearer {METRICS_TOKEN}'}),
+                timeout=2).read()
+            return processes
+        except OSError:
+            time.sleep(0.5)
+    stop_processes(processes)
+    raise RuntimeError(f'gunicorn did not answer within 60 seconds, see {log.name}')
+
+
+def stop_processes(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def run_scenario(name, args, deletable_ids, log):
+    settings = SCENARIOS[name]
+    host, port = '127.0.0.1', args.port
+    recorder, stop, pools = Recorder(), threading.Event(), {}
+    processes = start_processes(args, log)
+    try:
+        threads = [threading.Thread(target=viewer, args=(host, port, recorder, stop, args.seed + index, args))
+                   for index in range(args.viewers)]
+        if settings['admin_interval'] is not None:
+            threads.append(threading.Thread(target=admin, args=(
+                f'http://{host}:{port}', recorder, stop, args.seed, deletable_ids, settings, args)))
+        threads.append(threading.Thread(target=sample_pools, args=(host, port, stop, pools)))
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        stop.set()
+        stop_processes(processes)
+    return {
+        'seconds': elapsed,
+        'requests': recorder.summary(elapsed),
+        'error_examples': recorder.error_examples,
+        'db_pool': pool_summary(pools),
+    }
+
+
+def prepare_database(args):
+    """Seed when asked to, then return ids of single events the admin may delete."""
+    os.environ.update(DATABASE_URL=args.database_url, RECURRENCE_MODE=args.recurrence_mode, EVENTS_CACHE='none')
+    from app import create_app
+    from models import db, Event
+    from benchmarks.seed import seed_events
+    app = create_app()
+    logging.getLogger().setLevel(logging.WARNING)
+    seeded = None
+    if args.reset:
+        reset_database(app)
+        with app.app_context():
+            seeded = seed_events(args.events, args.series, SEED_START, SEED_DAYS,
+                                 materialize=args.recurrence_mode == 'materialize', seed=args.seed)
+    with app.app_context():
+        deletable_ids = [row.id for row in db.session.query(Event.id).filter(
+            Event.is_recurring.isnot(True), Event.series_id.is_(None))]
+        db.engine.dispose()
+    random.Random(args.seed).shuffle(deletable_ids)
+    return seeded, deletable_ids
+
+
+def print_report(name, result):
+    pool = result['db_pool']
+    print(f"\n{name}: {result['seconds']:.0f}s, pool peak {pool.get('peak_in_use', '?')}"
+          f"/{pool.get('capacity_per_worker', '?')} connections per worker over {pool['workers_sampled']} workers")
+    print(f"{'request':22} {'count':>7} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8}")
+    for kind, stats in sorted(result['requests'].items(), key=lambda item: item[0] == 'all'):
+        print(f"{kind:22} {stats['requests']:7d} {stats['error_rate']:7.1%} {stats['p50_ms']:9.1f} "
+              f"{stats['p95_ms']:9.1f} {stats['p99_ms']:9.1f} {stats['throughput_rps']:8.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the calendar with embed viewers and admin writes.')
+    parser.add_argument('--database-url', required=True, help='PostgreSQL database the server runs against')
+    parser.add_argument('--reset', action='store_true', help='drop all tables and seed synthetic data first')
+    parser.add_argument('--events', type=int, default=20000, help='single events to seed with --reset')
+    parser.add_argument('--series', type=int, default=200, help='recurring series to seed with --reset')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='scenario to run, repeatable, defaults to all')
+    parser.add_argument('--viewers', type=int, default=50, help='concurrent embed viewers')
+    parser.add_argument('--duration', type=float, default=30, help='seconds per scenario')
+    parser.add_argument('--think-time', type=float, default=0.5, help='mean seconds a viewer waits between months')
+    parser.add_argument('--navigations', type=int, default=3, help='months a viewer pages forward per visit')
+    parser.add_argument('--delete-batch', type=int, default=50, help='ids per bulk_delete_events call')
+    parser.add_argument('--admin-password', default='admin')
+    parser.add_argument('--workers', type=int, help='gunicorn worker processes (WEB_CONCURRENCY)')
+    parser.add_argument('--threads', type=int, help='threads per gthread worker (GUNICORN_THREADS)')
+    parser.add_argument('--worker-class', choices=['sync', 'gthread', 'gevent'])
+    parser.add_argument('--pool-size', type=int, help='SQLAlchemy pool size per worker (DB_POOL_SIZE)')
+    parser.add_argument('--max-overflow', type=int, help='SQLAlchemy overflow per worker (DB_MAX_OVERFLOW)')
+    parser.add_argument('--job-workers', type=int, default=0,
+                        help='run writes through JOBS_MODE=queue with this many `flask jobs worker` processes')
+    parser.add_argument('--recurrence-mode', choices=['virtual', 'materialize'], default='virtual')
+    parser.add_argument('--occurrence-index', action='store_true')
+    parser.add_argument('--cache', choices=['none', 'memory', 'sqlite'], default='memory')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--timeout', type=float, default=10, help='seconds before a request counts as failed')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--max-error-rate', type=float,
+                        help='exit non-zero when a scenario fails more than this fraction of requests')
+    parser.add_argument('--server-log', help='gunicorn output, defaults to a temporary file')
+    args = parser.parse_args(argv)
+    if not args.database_url.startswith('postgresql'):
+        parser.error('--database-url must point at PostgreSQL, gunicorn workers share it concurrently')
+
+    seeded, deletable_ids = prepare_database(args)
+    server_log = args.server_log or tempfile.mkstemp(prefix='calendar-load-', suffix='.log')[1]
+    results = {}
+    with open(server_log, 'ab') as log:
+        for name in args.scenario or list(SCENARIOS):
+            results[name] = run_scenario(name, args, deletable_ids, log)
+            print_report(name, results[name])
+    print(f'\ngunicorn output: {server_log}')
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'server': {key: value for key, value in server_environment(args).items() if key in (
+                'WEB_CONCURRENCY', 'GUNICORN_THREADS', 'GUNICORN_WORKER_CLASS', 'DB_POOL_SIZE', 'DB_MAX_OVERFLOW',
+                'RECURRENCE_MODE', 'EVENTS_CACHE', 'OCCURRENCE_INDEX', 'JOBS_MODE')},
+            'job_workers': args.job_workers,
+            'viewers': args.viewers,
+            'duration': args.duration,
+            'think_time': args.think_time,
+            'seeded': seeded,
+        },
+        'scenarios': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(report, handle, indent=2)
+    if args.max_error_rate is not None and any(
+            result['requests'].get('all', {}).get('error_rate', 0) > args.max_error_rate for result in results.values()):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,239 @@
+"""Backend benchmark for the calendar.
+
+Seeds a database with synthetic events and times the hot routes through the
+Flask test client, so numbers reflect the application and database only.
+
+    python -m benchmarks.run --events 20000 --series 200 --output bench.json
+    python -m benchmarks.run --baseline bench.json
+    python -m benchmarks.run --query-budget get_events=4 --query-budget manage_events=2
+
+Without --database-url a throwaway SQLite file is used. Pointing it at a
+PostgreSQL database requires --reset, which drops and recreates all tables.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+WINDOW_WIDTHS = (7, 31, 92, 365)
+SEED_START = date(2024, 1, 1)
+SEED_DAYS = 730
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples, total_seconds):
+    return {
+        'runs': len(samples),
+        'mean_ms': statistics.mean(samples) * 1000,
+        'p50_ms': percentile(samples, 0.50) * 1000,
+        'p95_ms': percentile(samples, 0.95) * 1000,
+        'max_ms': max(samples) * 1000,
+        'throughput_rps': len(samples) / total_seconds if total_seconds else None,
+    }
+
+
+def measure(call, repeat):
+    samples = []
+    started = time.perf_counter()
+    for run in range(repeat):
+        before = time.perf_counter()
+        response = call(run)
+        samples.append(time.perf_counter() - before)
+        if response.status_code >= 400:
+            raise RuntimeError(f'benchmark request failed with status {response.status_code}')
+    return summarize(samples, time.perf_counter() - started)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def reset_database(app):
+    from models import db, User
+    from werkzeug.security import generate_password_hash
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(User(username='admin', password=generate_password_hash('admin')))
+        db.session.commit()
+
+
+def run_benchmarks(app, args):
+    from models import db, Event
+    from benchmarks.seed import seed_events
+
+    rng = random.Random(args.seed)
+    results = {}
+
+    with app.app_context():
+        started = time.perf_counter()
+        seeded = seed_events(args.events, args.series, SEED_START, SEED_DAYS,
+                             materialize=app.config['RECURRENCE_MODE'] == 'materialize', seed=args.seed)
+        seeded['seconds'] = time.perf_counter() - started
+
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin'})
+
+    for width in WINDOW_WIDTHS:
+        def fetch_window(run, width=width):
+            start = SEED_START + timedelta(days=rng.randrange(SEED_DAYS - width))
+            end = start + timedelta(days=width - 1)
+            return client.get(f'/events?start_date={start.isoformat()}&end_date={end.isoformat()}')
+        results[f'events_window_{width}d'] = measure(fetch_window, args.repeat)
+
+    def fetch_summary(run):
+        start = SEED_START + timedelta(days=rng.randrange(SEED_DAYS - 365))
+        end = start + timedelta(days=364)
+        return client.get(f'/events/summary?start_date={start.isoformat()}&end_date={end.isoformat()}')
+    results['events_summary_365d'] = measure(fetch_summary, args.repeat)
+
+    results['manage_events'] = measure(lambda run: client.get('/manage_events'), args.repeat)
+    results['manage_events_filtered'] = measure(
+        lambda run: client.get('/manage_events?category=work&q=Termin%201&start_date=2024-06-01'), args.repeat)
+
+    def add_daily(run):
+        return client.post('/add_event', data={
+            'name': f'Bench täglich {run}',
+            'date': (SEED_START + timedelta(days=rng.randrange(SEED_DAYS))).isoformat(),
+            'time': '09:00',
+            'category': 'work',
+            'is_recurring': 'y',
+            'recurrence_type': 'daily',
+        })
+    results['add_event_daily'] = measure(add_daily, args.repeat)
+
+    with app.app_context():
+        candidate_ids = [row.id for row in db.session.query(Event.id).filter(Event.is_recurring.isnot(True))
+                         .limit(args.repeat * args.delete_batch)]
+    rng.shuffle(candidate_ids)
+
+    def bulk_delete(run):
+        batch = candidate_ids[run * args.delete_batch:(run + 1) * args.delete_batch]
+        return client.post('/bulk_delete_events', data={'event_ids': [str(event_id) for event_id in batch]})
+    if len(candidate_ids) >= args.repeat * args.delete_batch:
+        results[f'bulk_delete_events_{args.delete_batch}'] = measure(bulk_delete, args.repeat)
+
+    return seeded, results
+
+
+def compare(results, baseline, threshold):
+    """Print p50 ratios against a previous run and return the names of regressed benchmarks."""
+    regressions = []
+    for name, current in sorted(results.items()):
+        previous = baseline.get('results', {}).get(name)
+        if not previous:
+            print(f'{name:32} {current["p50_ms"]:10.2f} ms   (new)')
+            continue
+        ratio = current['p50_ms'] / previous['p50_ms'] if previous['p50_ms'] else float('inf')
+        marker = '  REGRESSION' if ratio > threshold else ''
+        print(f'{name:32} {current["p50_ms"]:10.2f} ms   x{ratio:.2f}{marker}')
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the calendar backend.')
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--reset', action='store_true', help='drop and recreate all tables before seeding')
+    parser.add_argument('--events', type=int, default=10000, help='number of single events to seed')
+    parser.add_argument('--series', type=int, default=100, help='number of recurring series to seed')
+    parser.add_argument('--recurrence-mode', choices=['virtual', 'materialize'], default='virtual')
+    parser.add_argument('--occurrence-index', action='store_true',
+                        help='serve /events from the event_occurrences day index')
+    parser.add_argument('--cache', choices=['none', 'memory', 'sqlite'], default='none',
+                        help='/events cache backend, off by default to measure the database path')
+    parser.add_argument('--repeat', type=int, default=20, help='runs per benchmark')
+    parser.add_argument('--delete-batch', type=int, default=50, help='ids per bulk_delete_events call')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='p50 ratio above which --baseline comparison fails')
+    parser.add_argument('--query-budget', action='append', default=[], metavar='ENDPOINT=N',
+                        help='fail when a request to ENDPOINT runs more than N SQL statements')
+    args = parser.parse_args(argv)
+
+    database_url = args.database_url
+    scratch_path = None
+    if database_url is None:
+        handle, scratch_path = tempfile.mkstemp(suffix='.sqlite3', prefix='calendar-bench-')
+        os.close(handle)
+        database_url = f'sqlite:///{scratch_path}'
+        args.reset = True
+    elif not args.reset:
+        parser.error('--reset is required with --database-url, the benchmark drops all tables')
+
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['RECURRENCE_MODE'] = args.recurrence_mode
+    os.environ['EVENTS_CACHE'] = args.cache
+    os.environ['OCCURRENCE_INDEX'] = 'true' if args.occurrence_index else 'false'
+    if args.query_budget:
+        os.environ['QUERY_PROFILER'] = 'true'
+        os.environ['QUERY_BUDGETS'] = ','.join(args.query_budget)
+
+    from app import create_app
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    logging.getLogger().setLevel(logging.WARNING)
+    reset_database(app)
+
+    seeded, results = run_benchmarks(app, args)
+    with app.app_context():
+        from models import db
+        dialect = db.engine.dialect.name
+        db.engine.dispose()
+    if scratch_path:
+        os.remove(scratch_path)
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'database': dialect,
+            'recurrence_mode': args.recurrence_mode,
+            'occurrence_index': args.occurrence_index,
+            'cache': args.cache,
+            'repeat': args.repeat,
+            'seeded': seeded,
+        },
+        'results': results,
+        'query_budget_violations': list(app.extensions['query_profiler'].violations),
+    }
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(report, handle, indent=2)
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as handle:
+            if compare(results, json.load(handle), args.threshold):
+                status = 1
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    for violation in report['query_budget_violations']:
+        print(f"query budget exceeded: {violation['endpoint']} ran {violation['queries']} statements "
+              f"(budget {violation['budget']}) for {violation['path']}", file=sys.stderr)
+        status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
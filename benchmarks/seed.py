@@ -0,0 +1,68 @@
+import random
+from datetime import date, time, timedelta
+from models import db, Event
+from routes import create_recurring_events
+from occurrence_index import rebuild_index
+
+CATEGORIES = ['default', 'work', 'personal', 'family', 'holiday']
+RECURRENCE_TYPES = ['daily', 'weekly', 'monthly', 'yearly', 'custom']
+
+
+def random_time(rng):
+    return time(rng.randrange(7, 20), rng.choice([0, 15, 30, 45]))
+
+
+def seed_events(single_count, series_count, start_date=date(2024, 1, 1), days=730,
+                materialize=False, seed=42, batch_size=5000):
+    """Fill the events table with synthetic single events and recurring series, return row counts."""
+    rng = random.Random(seed)
+
+    rows = []
+    for index in range(single_count):
+        rows.append({
+            'name': f'Termin {index}',
+            'date': start_date + timedelta(days=rng.randrange(days)),
+            'time': random_time(rng),
+            'is_recurring': False,
+            'category': rng.choice(CATEGORIES),
+        })
+        if len(rows) == batch_size:
+            db.session.execute(db.insert(Event), rows)
+            rows = []
+    if rows:
+        db.session.execute(db.insert(Event), rows)
+    db.session.commit()
+
+    masters = []
+    for index in range(series_count):
+        first = start_date + timedelta(days=rng.randrange(days))
+        recurrence_type = rng.choice(RECURRENCE_TYPES)
+        master = Event(
+            name=f'Serie {index}',
+            date=first,
+            time=random_time(rng),
+            is_recurring=True,
+            recurrence_type=recurrence_type,
+            category=rng.choice(CATEGORIES),
+        )
+        if recurrence_type == 'custom':
+            master.custom_recurrence_dates = sorted(
+                first + timedelta(days=rng.randrange(1, 365)) for _ in range(rng.randrange(1, 50)))
+        elif rng.random() < 0.5:
+            master.recurrence_end_date = first + timedelta(days=rng.randrange(30, 365))
+        masters.append(master)
+    db.session.add_all(masters)
+    db.session.commit()
+
+    materialized = 0
+    if materialize:
+        for master in masters:
+            materialized += create_recurring_events(master)
+
+    return {
+        'single_events': single_count,
+        'series': series_count,
+        'materialized_occurrences': materialized,
+        'indexed_occurrences': rebuild_index(),
+        'total_rows': db.session.query(db.func.count(Event.id)).scalar(),
+    }
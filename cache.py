@@ -0,0 +1,247 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class MemoryBackend:
+    """LRU cache local to one worker process."""
+
+    # Only holds a lock for a dict lookup, safe to call from the event loop
+    blocking = False
+    # Invalidations made by other workers never reach it
+    shared = False
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            body, stored_at = entry
+            if self.ttl and time.monotonic() - stored_at > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return body
+
+    def set(self, key, body, generation):
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.entries[key] = (body, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def current_generation(self):
+        return self.generation
+
+    def invalidate(self, start_date, end_date):
+        with self.lock:
+            self.generation += 1
+            stale = [key for key in self.entries if key[1] <= end_date and key[2] >= start_date]
+            for key in stale:
+                del self.entries[key]
+            return len(stale)
+
+    def size(self):
+        return len(self.entries)
+
+
+class SQLiteBackend:
+    """Cache file shared by all gunicorn workers on the same host."""
+
+    # File I/O and lock waits of up to the connect timeout, kept off the event loop
+    blocking = True
+    shared = True
+
+    def __init__(self, path, max_entries, ttl):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        with self.connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS windows ('
+                'variant TEXT, start_date TEXT, end_date TEXT, body BLOB, stored_at REAL, used_at REAL, '
+                'PRIMARY KEY (variant, start_date, end_date))'
+            )
+            conn.execute('CREATE TABLE IF NOT EXISTS generation (id INTEGER PRIMARY KEY, value INTEGER)')
+            conn.execute('INSERT OR IGNORE INTO generation (id, value) VALUES (1, 0)')
+
+    @contextmanager
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        variant, start_date, end_date = key
+        now = time.time()
+        with self.connect() as conn:
+            row = conn.execute(
+                'SELECT body, stored_at FROM windows WHERE variant = ? AND start_date = ? AND end_date = ?',
+                (variant, start_date.isoformat(), end_date.isoformat())
+            ).fetchone()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                return None
+            conn.execute(
+                'UPDATE windows SET used_at = ? WHERE variant = ? AND start_date = ? AND end_date = ?',
+                (now, variant, start_date.isoformat(), end_date.isoformat())
+            )
+            return row[0]
+
+    def set(self, key, body, generation):
+        variant, start_date, end_date = key
+        now = time.time()
+        with self.connect() as conn:
+            if conn.execute('SELECT value FROM generation WHERE id = 1').fetchone()[0] != generation:
+                return
+            conn.execute(
+                'INSERT OR REPLACE INTO windows VALUES (?, ?, ?, ?, ?, ?)',
+                (variant, start_date.isoformat(), end_date.isoformat(), body, now, now)
+            )
+            conn.execute(
+                'DELETE FROM windows WHERE rowid NOT IN (SELECT rowid FROM windows ORDER BY used_at DESC LIMIT ?)',
+                (self.max_entries,)
+            )
+
+    def current_generation(self):
+        with self.connect() as conn:
+            return conn.execute('SELECT value FROM generation WHERE id = 1').fetchone()[0]
+
+    def invalidate(self, start_date, end_date):
+        with self.connect() as conn:
+            conn.execute('UPDATE generation SET value = value + 1 WHERE id = 1')
+            return conn.execute(
+                'DELETE FROM windows WHERE start_date <= ? AND end_date >= ?',
+                (end_date.isoformat(), start_date.isoformat())
+            ).rowcount
+
+    def size(self):
+        with self.connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM windows').fetchone()[0]
+
+
+class EventWindowCache:
+    """Serialized /events responses keyed by date window, dropped when a write touches the window."""
+
+    def __init__(self, app=None):
+        self.backend = None
+        # Called with (start_date, end_date) on every invalidation, e.g. to refresh embed snapshots
+        self.listeners = []
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.configure(app.config)
+        app.extensions['events_cache'] = self
+
+    def configure(self, config):
+        """Set up the backend from a Flask config or any dict, missing keys are filled from the environment."""
+        config.setdefault('EVENTS_CACHE', os.environ.get('EVENTS_CACHE', 'memory'))
+        config.setdefault('EVENTS_CACHE_SIZE', int(os.environ.get('EVENTS_CACHE_SIZE', 256)))
+        # Bounds how long another worker's in-process copy can lag behind a write
+        config.setdefault('EVENTS_CACHE_TTL', int(os.environ.get('EVENTS_CACHE_TTL', 30)))
+        config.setdefault('EVENTS_CACHE_PATH', os.environ.get(
+            'EVENTS_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'event_window_cache.sqlite3')))
+
+        kind = config['EVENTS_CACHE']
+        if kind == 'memory':
+            self.backend = MemoryBackend(config['EVENTS_CACHE_SIZE'], config['EVENTS_CACHE_TTL'])
+        elif kind == 'sqlite':
+            self.backend = SQLiteBackend(
+                config['EVENTS_CACHE_PATH'], config['EVENTS_CACHE_SIZE'], config['EVENTS_CACHE_TTL'])
+        elif kind == 'none':
+            self.backend = None
+        else:
+            raise ValueError(f"Unknown EVENTS_CACHE backend: {kind}")
+
+    def key(self, start_date, end_date, variant, version):
+        # A body another worker's write made stale must not be served under the new version's ETag
+        if version is not None and not self.backend.shared:
+            variant = f'{variant}@{version}'
+        return variant, start_date, end_date
+
+    def fetch(self, start_date, end_date, build, variant='json', version=None):
+        """Return the cached body for the window, calling build() and storing its result on a miss.
+
+        version is the events_version the caller derives its ETag from, if any.
+        """
+        if self.backend is None:
+            return build()
+        key = self.key(start_date, end_date, variant, version)
+        body = self.backend.get(key)
+        if body is not None:
+            self.hits += 1
+            return body
+        self.misses += 1
+        # A write landing while build() runs bumps the generation and keeps the stale body out
+        generation = self.backend.current_generation()
+        body = build()
+        self.backend.set(key, body, generation)
+        return body
+
+    async def fetch_async(self, start_date, end_date, build, variant='json', version=None):
+        """Same as fetch() for a coroutine function build, used by the async embed API."""
+        if self.backend is None:
+            return await build()
+        key = self.key(start_date, end_date, variant, version)
+        body = await self.run_backend(self.backend.get, key)
+        if body is not None:
+            self.hits += 1
+            return body
+        self.misses += 1
+        generation = await self.run_backend(self.backend.current_generation)
+        body = await build()
+        await self.run_backend(self.backend.set, key, body, generation)
+        return body
+
+    async def run_backend(self, method, *args):
+        # Blocking backends run in the default thread pool, each call opens its own connection
+        if self.backend.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    def on_invalidate(self, listener):
+        if listener not in self.listeners:
+            self.listeners.append(listener)
+
+    def invalidate(self, start_date, end_date):
+        dropped = 0
+        if self.backend is not None:
+            dropped = self.backend.invalidate(start_date, end_date)
+            self.invalidations += 1
+        for listener in self.listeners:
+            listener(start_date, end_date)
+        return dropped
+
+    def stats(self):
+        return {
+            'backend': type(self.backend).__name__ if self.backend else None,
+            'pid': os.getpid(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'entries': self.backend.size() if self.backend else 0,
+        }
+
+
+events_cache = EventWindowCache()
@@ -0,0 +1,145 @@
+import signal
+from datetime import timedelta
+import click
+from flask_migrate import stamp, upgrade
+from werkzeug.security import generate_password_hash
+from models import db, User
+from occurrence_index import rebuild_index, verify_index
+from importer import detect_format, import_rows, read_rows
+from jobs import job_counts, purge_jobs, requeue_stale, work
+from snapshots import prune_snapshots, render_snapshots
+from routes import create_recurring_events
+
+# Last revision of the schema that databases built by the old db.create_all() at startup already have
+LEGACY_SCHEMA_REVISION = 'f9dd6e8d8417'
+
+
+def init_db(admin_password='admin'):
+    """Create or migrate the schema and seed the admin user, returns what was done."""
+    actions = []
+    tables = db.inspect(db.engine).get_table_names()
+    if 'events' not in tables:
+        db.create_all()
+        stamp()
+        actions.append('Schema created')
+    else:
+        if 'alembic_version' not in tables:
+            stamp(revision=LEGACY_SCHEMA_REVISION)
+        upgrade()
+        actions.append('Schema migrated')
+        if 'event_occurrences' not in tables:
+            actions.append(f'Occurrence index built ({rebuild_index()} rows)')
+
+    if not User.query.filter_by(username='admin').first():
+        db.session.add(User(username='admin', password=generate_password_hash(admin_password)))
+        db.session.commit()
+        actions.append('Admin user created')
+    return actions
+
+
+def init_commands(app):
+    @app.cli.command('init-db')
+    @click.option('--admin-password', default='admin', help='Password for the admin user if it has to be created.')
+    def init_db_command(admin_password):
+        """Create or migrate the schema and seed the admin user."""
+        for action in init_db(admin_password):
+            click.echo(action)
+
+    @app.cli.group('occurrences')
+    def occurrences_group():
+        """Maintain the event_occurrences day index."""
+
+    @occurrences_group.command('rebuild')
+    @click.option('--batch-size', default=1000, show_default=True)
+    def rebuild_command(batch_size):
+        """Rewrite the day index from the events table."""
+        click.echo(f'{rebuild_index(batch_size)} rows written')
+
+    @occurrences_group.command('verify')
+    @click.option('--batch-size', default=1000, show_default=True)
+    def verify_command(batch_size):
+        """Check the day index against the events table, exits with status 1 on any difference."""
+        report = verify_index(batch_size)
+        click.echo(f"{report['events']} events, {report['rows']} index rows, "
+                   f"{report['missing_count']} missing, {report['extra_count']} extra")
+        for kind in ('missing', 'extra'):
+            for day, time, event_id in report[kind]:
+                click.echo(f'  {kind}: {day.isoformat()} {time.isoformat()} event {event_id}')
+        if report['missing_count'] or report['extra_count']:
+            raise SystemExit(1)
+
+    @app.cli.command('import-events')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'import_format', type=click.Choice(['csv', 'ics']), help='Defaults to the file extension.')
+    @click.option('--batch-size', type=int, help='Rows per transaction, defaults to IMPORT_BATCH_SIZE.')
+    @click.option('--dry-run', is_flag=True, help='Validate and deduplicate without writing anything.')
+    def import_events_command(path, import_format, batch_size, dry_run):
+        """Import events from a CSV or ICS file."""
+        expand_series = create_recurring_events if app.config['RECURRENCE_MODE'] == 'materialize' else None
+        with open(path, 'rb') as handle:
+            try:
+                report = import_rows(read_rows(handle, detect_format(path, import_format)),
+                                     batch_size=batch_size or app.config['IMPORT_BATCH_SIZE'],
+                                     expand_series=expand_series, dry_run=dry_run,
+                                     timezone=app.config['IMPORT_TIMEZONE'])
+            except ValueError as error:
+                raise click.ClickException(str(error))
+        for error in report['errors']:
+            click.echo(f"line {error['line']}: {error['error']}", err=True)
+        click.echo(f"{report['rows']} rows, {report['imported']} imported, {report['duplicates']} duplicates, "
+                   f"{len(report['errors'])} errors in {report['seconds']:.2f}s "
+                   f"({report['rows_per_second'] or 0:.0f} rows/s){' (dry run)' if dry_run else ''}")
+
+    @app.cli.group('embed-snapshots')
+    def snapshots_group():
+        """Maintain the pre-rendered embed pages."""
+
+    @snapshots_group.command('render')
+    def render_snapshots_command():
+        """Render every month in range and delete snapshots of months that left it."""
+        written = render_snapshots()
+        removed = prune_snapshots()
+        click.echo(f"{len(written)} months rendered ({written[0]} to {written[-1]}), {len(removed)} removed"
+                   if written else f'Nothing to render, {len(removed)} removed')
+
+    @app.cli.group('jobs')
+    def jobs_group():
+        """Run and maintain the background job queue."""
+
+    @jobs_group.command('worker')
+    @click.option('--poll-interval', type=float, help='Seconds between polls of an empty queue, defaults to JOBS_POLL_INTERVAL.')
+    @click.option('--burst', is_flag=True, help='Exit once the queue is empty.')
+    def worker_command(poll_interval, burst):
+        """Process queued jobs until stopped."""
+        stopping = []
+
+        # SIGTERM from the process manager lets the current job finish first
+        def stop(signum, frame):
+            click.echo('Stopping after the current job')
+            stopping.append(signum)
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        processed = work(poll_interval or app.config['JOBS_POLL_INTERVAL'], burst=burst,
+                         should_stop=lambda: bool(stopping))
+        click.echo(f'{processed} jobs processed')
+
+    @jobs_group.command('status')
+    def jobs_status_command():
+        """Show the number of jobs per status."""
+        counts = job_counts()
+        click.echo(', '.join(f'{counts.get(status, 0)} {status}' for status in ('queued', 'running', 'done', 'failed')))
+
+    @jobs_group.command('requeue-stale')
+    @click.option('--minutes', default=30, show_default=True, help='Running for longer than this.')
+    def requeue_stale_command(minutes):
+        """Queue jobs again whose worker died while running them."""
+        click.echo(f'{requeue_stale(timedelta(minutes=minutes))} jobs requeued')
+
+    @jobs_group.command('purge')
+    @click.option('--days', default=7, show_default=True, help='Finished longer ago than this.')
+    def purge_command(days):
+        """Delete old finished and failed jobs."""
+        click.echo(f'{purge_jobs(timedelta(days=days))} jobs deleted')
+
+    return app
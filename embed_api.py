@@ -0,0 +1,234 @@
+"""Async read-only API for the public embed widget.
+
+Serves GET /events, /events/months, /events/summary and /child_embed as a plain ASGI application on an
+asyncpg connection pool, without sessions, CSRF or Flask-Login. Responses are
+byte-for-byte the same as the Flask routes, so a reverse proxy can send these
+paths here and everything else to gunicorn:
+
+    uvicorn embed_api:app --workers 2 --port 5001
+
+Configuration comes from the same environment as the Flask app (DATABASE_URL,
+EVENTS_CACHE*, EVENTS_MAX_AGE, EVENTS_MAX_MONTHS, EMBED_MAX_AGE,
+OCCURRENCE_INDEX) plus ASYNC_DB_POOL_SIZE and ASYNC_DB_MAX_OVERFLOW. Use
+EVENTS_CACHE=sqlite so writes made through the Flask app invalidate the
+windows cached here.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+from cache import EventWindowCache
+from events_version import version_query, window_etag
+from occurrence_index import index_summary_query, index_window_query
+from recurrence import (add_months, merge_window, summarize_window, summary_single_events_query, window_series_query,
+                        window_single_events_query)
+from wire import WINDOW_MIMETYPES, cache_variant, compress, encode_summary, encode_window, negotiate
+
+EMBED_VIEWS = ('month', 'year')
+
+
+def async_database_url(url):
+    return make_url(url).set(drivername='postgresql+asyncpg')
+
+
+class EmbedAPI:
+    def __init__(self):
+        self.engine = None
+        self.sessions = None
+        self.cache = EventWindowCache()
+        self.embed_pages = {}
+        self.events_max_age = int(os.environ.get('EVENTS_MAX_AGE', 60))
+        self.embed_max_age = int(os.environ.get('EMBED_MAX_AGE', 300))
+        self.max_months = int(os.environ.get('EVENTS_MAX_MONTHS', 12))
+        self.occurrence_index = os.environ.get('OCCURRENCE_INDEX', 'false').lower() == 'true'
+
+    async def startup(self):
+        self.engine = create_async_engine(
+            async_database_url(os.environ['DATABASE_URL']),
+            pool_size=int(os.environ.get('ASYNC_DB_POOL_SIZE', 20)),
+            max_overflow=int(os.environ.get('ASYNC_DB_MAX_OVERFLOW', 10)),
+            pool_recycle=300,
+            pool_pre_ping=True,
+        )
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.cache.configure({})
+        self.render_embed_pages()
+
+    async def shutdown(self):
+        if self.engine is not None:
+            await self.engine.dispose()
+
+    def render_embed_pages(self):
+        # The embed page only varies by view, render each variant once through the Flask templates
+        from flask import render_template
+        from app import create_app
+        flask_app = create_app()
+        for view in EMBED_VIEWS:
+            with flask_app.test_request_context(f'/child_embed?view={view}'):
+                self.embed_pages[view] = render_template('child_embed.html', embedded=True, view=view).encode('utf-8')
+
+    async def load_occurrences(self, start_date, end_date):
+        async with self.sessions() as session:
+            if self.occurrence_index:
+                return [(day, event) for day, event in await session.execute(index_window_query(start_date, end_date))]
+            single_events = (await session.scalars(window_single_events_query(start_date, end_date))).all()
+            series = (await session.scalars(window_series_query(start_date, end_date))).all()
+        return merge_window(single_events, series, start_date, end_date)
+
+    async def load_summary(self, start_date, end_date):
+        async with self.sessions() as session:
+            if self.occurrence_index:
+                return summarize_window((await session.execute(index_summary_query(start_date, end_date))).all())
+            rows = (await session.execute(summary_single_events_query(start_date, end_date))).all()
+            series = (await session.scalars(window_series_query(start_date, end_date))).all()
+        return summarize_window(rows, series, start_date, end_date)
+
+    def negotiate(self, headers):
+        return negotiate(parse_accept_header(headers.get(b'accept', b'').decode('latin-1'), MIMEAccept),
+                         parse_accept_header(headers.get(b'accept-encoding', b'').decode('latin-1')))
+
+    async def events_version(self):
+        async with self.sessions() as session:
+            return await session.scalar(version_query()) or 0
+
+    async def fetch_window(self, headers, version, start_date, end_date, build, variant):
+        """Same as routes.fetch_window: the ETag and the body, which stays empty when If-None-Match matches."""
+        etag = window_etag(version, variant, start_date, end_date)
+        if f'"{etag}"' in headers.get(b'if-none-match', b'').decode('latin-1'):
+            return etag, b''
+        return etag, await self.cache.fetch_async(start_date, end_date, build, variant=variant, version=version)
+
+    def window_response(self, etag, body, window_format, encoding):
+        headers = {'cache-control': f'public, max-age={self.events_max_age}', 'vary': 'Accept, Accept-Encoding',
+                   'etag': f'"{etag}"'}
+        if encoding:
+            headers['content-encoding'] = encoding
+        return 200, WINDOW_MIMETYPES[window_format], body, headers
+
+    async def events(self, query, headers):
+        try:
+            start_date = datetime.strptime(query['start_date'][0], '%Y-%m-%d').date()
+            end_date = datetime.strptime(query['end_date'][0], '%Y-%m-%d').date()
+        except (KeyError, ValueError):
+            return 400, 'application/json', b'{"error":"start_date und end_date sind erforderlich"}\n', {}
+
+        window_format, encoding = self.negotiate(headers)
+
+        async def build_window():
+            return compress(encode_window(await self.load_occurrences(start_date, end_date), window_format), encoding)
+
+        etag, body = await self.fetch_window(headers, await self.events_version(), start_date, end_date,
+                                             build_window, cache_variant(window_format, encoding))
+        return self.window_response(etag, body, window_format, encoding)
+
+    async def summary(self, query, headers):
+        try:
+            start_date = datetime.strptime(query['start_date'][0], '%Y-%m-%d').date()
+            end_date = datetime.strptime(query['end_date'][0], '%Y-%m-%d').date()
+        except (KeyError, ValueError):
+            return 400, 'application/json', b'{"error":"start_date und end_date sind erforderlich"}\n', {}
+
+        _, encoding = self.negotiate(headers)
+
+        async def build_summary():
+            return compress(encode_summary(await self.load_summary(start_date, end_date)), encoding)
+
+        etag, body = await self.fetch_window(headers, await self.events_version(), start_date, end_date,
+                                             build_summary, 'summary:' + cache_variant('json', encoding))
+        return self.window_response(etag, body, 'json', encoding)
+
+    async def months(self, query, headers):
+        try:
+            first_month = datetime.strptime(query['start'][0], '%Y-%m').date()
+            count = int(query.get('count', ['3'])[0])
+        except (KeyError, ValueError):
+            return 400, 'application/json', b'{"error":"start (JJJJ-MM) ist erforderlich"}\n', {}
+        if not 1 <= count <= self.max_months:
+            error = {'error': f'count muss zwischen 1 und {self.max_months} liegen'}
+            return 400, 'application/json', json.dumps(error, separators=(',', ':')).encode('utf-8') + b'\n', {}
+
+        window_format, encoding = self.negotiate(headers)
+        months = [add_months(first_month, offset) for offset in range(count)]
+        month_ends = [add_months(month, 1) - timedelta(days=1) for month in months]
+        loaded, version = {}, await self.events_version()
+
+        # Same scheme as the Flask route: per-month cache entries, one query for all misses
+        async def build_month(month_start, month_end):
+            if not loaded:
+                loaded['occurrences'] = await self.load_occurrences(months[0], month_ends[-1])
+            return encode_window(
+                (occurrence for occurrence in loaded['occurrences'] if month_start <= occurrence[0] <= month_end),
+                window_format)
+
+        async def build_months():
+            parts = []
+            for month_start, month_end in zip(months, month_ends):
+                body = await self.cache.fetch_async(
+                    month_start, month_end, lambda: build_month(month_start, month_end), variant=window_format,
+                    version=version)
+                parts.append(b'"' + month_start.strftime('%Y-%m').encode() + b'":' + body.rstrip())
+            return compress(b'{' + b','.join(parts) + b'}\n', encoding)
+
+        etag, body = await self.fetch_window(headers, version, months[0], month_ends[-1], build_months,
+                                             'months:' + cache_variant(window_format, encoding))
+        return self.window_response(etag, body, window_format, encoding)
+
+    async def child_embed(self, query, headers):
+        view = query.get('view', ['month'])[0]
+        body = self.embed_pages.get(view, self.embed_pages['month'])
+        return 200, 'text/html; charset=utf-8', body, {'cache-control': f'public, max-age={self.embed_max_age}'}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        routes = {
+            '/events': self.events,
+            '/events/months': self.months,
+            '/events/summary': self.summary,
+            '/child_embed': self.child_embed,
+        }
+        handler = routes.get(scope['path'])
+        request_headers = dict(scope['headers'])
+        if handler is None or scope['method'] not in ('GET', 'HEAD'):
+            status, content_type, body, headers = 404, 'text/plain', b'Not Found', {}
+        else:
+            status, content_type, body, headers = await handler(
+                parse_qs(scope['query_string'].decode('latin-1')), request_headers)
+
+        if status == 200:
+            # Windows bring a version based ETag, the static embed page is hashed
+            etag = headers.setdefault('etag', f'"{hashlib.sha1(body).hexdigest()}"')
+            if etag in request_headers.get(b'if-none-match', b'').decode('latin-1'):
+                status, body = 304, b''
+
+        headers['content-type'] = content_type
+        headers['content-length'] = str(len(body))
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()],
+        })
+        await send({'type': 'http.response.body', 'body': b'' if scope['method'] == 'HEAD' else body})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.startup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+app = EmbedAPI()
@@ -0,0 +1,33 @@
+"""A database-wide version of the events table for the ETags of the window endpoints.
+
+Every events_cache invalidation bumps it. /events, /events/months, /events/summary
+and /events.ics derive their ETag from the version, the variant and the window,
+so a matching If-None-Match costs one primary key lookup: the body is neither
+loaded nor looked up in the cache. Any write changes every ETag, clients just
+revalidate once more than strictly needed.
+"""
+import hashlib
+from models import db, EventsVersion
+
+
+def version_query():
+    return db.select(EventsVersion.value).where(EventsVersion.id == 1)
+
+
+def current_version():
+    return db.session.scalar(version_query()) or 0
+
+
+def bump_version(start_date, end_date):
+    # Listener of events_cache.invalidate, which runs after the write has been committed
+    bumped = db.session.execute(
+        db.update(EventsVersion).where(EventsVersion.id == 1).values(value=EventsVersion.value + 1)
+    ).rowcount
+    if not bumped:
+        # Schemas created by db.create_all() start without the row
+        db.session.add(EventsVersion(id=1, value=1))
+    db.session.commit()
+
+
+def window_etag(version, variant, start_date, end_date):
+    return hashlib.sha1(f'{version}:{variant}:{start_date.isoformat()}:{end_date.isoformat()}'.encode()).hexdigest()
@@ -0,0 +1,94 @@
+"""Production server settings, picked up automatically by `gunicorn "app:create_app()"`.
+
+Everything can be overridden through the environment:
+
+    WEB_CONCURRENCY          worker processes (default: 2 x usable CPU cores + 1, capped by DB_MAX_CONNECTIONS)
+    GUNICORN_WORKER_CLASS    sync, gthread or gevent (default: gthread)
+    GUNICORN_THREADS         threads per gthread worker (default: 4)
+    GUNICORN_CONNECTIONS     concurrent clients per gevent worker (default: 1000)
+    GUNICORN_PRELOAD         import the app once in the master and fork it (default: true, false for gevent)
+    DB_MAX_CONNECTIONS       database connections all workers together may open (default: 80)
+    PORT                     listen port (default: 5000)
+
+DB_MAX_CONNECTIONS should stay below PostgreSQL's max_connections (100 by
+default) minus what job workers, the embed API and maintenance sessions need.
+"""
+import logging
+import multiprocessing
+import os
+
+
+def usable_cpus():
+    """CPUs this process may actually run on, honouring affinity masks and a cgroup v2 CPU quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = multiprocessing.cpu_count()
+    # Containers usually limit CPU time through the quota, cpu_count() still sees every host core
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as cpu_max:
+            quota, period = cpu_max.read().split()
+        if quota != 'max':
+            cpus = min(cpus, max(int(quota) // int(period), 1))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_connections = int(os.environ.get('GUNICORN_CONNECTIONS', 1000))
+# Workers share the imported code copy-on-write, create_app does not touch the database so forking is safe.
+# Not for gevent: the worker monkey-patches after the fork, so psycopg2, ssl and threading would be
+# imported unpatched in the master.
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'false' if worker_class == 'gevent' else 'true').lower() == 'true'
+keepalive = 5
+timeout = 30
+graceful_timeout = 30
+max_requests = 2000
+max_requests_jitter = 200
+accesslog = '-'
+
+# Size each worker's SQLAlchemy pool to the requests it can run at once, read by create_app
+if worker_class == 'gevent':
+    pool_size, max_overflow = min(worker_connections, 20), 10
+elif worker_class == 'gthread':
+    pool_size, max_overflow = threads, max(threads // 2, 1)
+else:
+    pool_size, max_overflow = 1, 1
+pool_size = int(os.environ.get('DB_POOL_SIZE', pool_size))
+max_overflow = int(os.environ.get('DB_MAX_OVERFLOW', max_overflow))
+
+# Every worker can hold pool_size + max_overflow connections, all of them together must fit the budget
+max_connections = int(os.environ.get('DB_MAX_CONNECTIONS', 80))
+if 'WEB_CONCURRENCY' in os.environ:
+    workers = int(os.environ['WEB_CONCURRENCY'])
+else:
+    workers = max(min(usable_cpus() * 2 + 1, max_connections // (pool_size + max_overflow)), 1)
+if workers * (pool_size + max_overflow) > max_connections:
+    # Shrink the pools instead, the overflow goes first
+    per_worker = max(max_connections // workers, 1)
+    max_overflow = min(max_overflow, max(per_worker - pool_size, 0))
+    pool_size = max(per_worker - max_overflow, 1)
+    logging.getLogger('gunicorn.error').warning(
+        'DB_MAX_CONNECTIONS=%d is too small for %d workers, pools reduced to %d + %d connections',
+        max_connections, workers, pool_size, max_overflow)
+os.environ['DB_POOL_SIZE'] = str(pool_size)
+os.environ['DB_MAX_OVERFLOW'] = str(max_overflow)
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        try:
+            from psycogreen.gevent import patch_psycopg
+            patch_psycopg()
+        except ImportError:
+            logging.getLogger('gunicorn.error').warning(
+                'psycogreen is not installed, database calls will block the gevent worker')
+
+    if preload_app:
+        # Never reuse pooled connections inherited from the master process
+        from models import db
+        with server.app.wsgi().app_context():
+            db.engine.dispose(close=False)
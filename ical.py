@@ -0,0 +1,96 @@
+from datetime import datetime, date
+from models import Event
+from recurrence import series_end
+
+DATE_TIME_FORMAT = '%Y%m%dT%H%M%S'
+
+
+def escape_text(value):
+    return (value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def fold_line(line):
+    # RFC 5545: content lines longer than 75 octets continue on a line starting with a space
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line
+    parts = []
+    while len(encoded) > 75:
+        cut = 75 if not parts else 74
+        while cut and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+    parts.append(encoded.decode('utf-8'))
+    return '\r\n '.join(parts)
+
+
+def format_date_time(day, time):
+    return datetime.combine(day, time).strftime(DATE_TIME_FORMAT)
+
+
+def recurrence_lines(event):
+    if event.recurrence_type == 'custom':
+        dates = sorted({d for d in event.custom_recurrence_dates or [] if d > event.date})
+        if not dates:
+            return []
+        return ['RDATE:' + ','.join(format_date_time(d, event.time) for d in dates)]
+
+    frequency = {'daily': 'DAILY', 'weekly': 'WEEKLY', 'monthly': 'MONTHLY', 'yearly': 'YEARLY'}.get(
+        event.recurrence_type)
+    if frequency is None:
+        return []
+    rule = f'FREQ={frequency}'
+    # Occurrences are clamped to the month end, e.g. the 31st falls on the 30th in April
+    if event.recurrence_type == 'monthly' and event.date.day > 28:
+        days = ','.join(str(day) for day in range(28, event.date.day + 1))
+        rule += f';BYMONTHDAY={days};BYSETPOS=-1'
+    elif event.recurrence_type == 'yearly' and (event.date.month, event.date.day) == (2, 29):
+        rule += ';BYMONTH=2;BYMONTHDAY=28,29;BYSETPOS=-1'
+    until = datetime.combine(series_end(event), event.time).strftime(DATE_TIME_FORMAT)
+    return [f'RRULE:{rule};UNTIL={until}']
+
+
+def event_lines(event, host):
+    stamp = (event.created_at or datetime.utcnow()).strftime(DATE_TIME_FORMAT) + 'Z'
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:event-{event.id}@{host}',
+        f'DTSTAMP:{stamp}',
+        f'DTSTART:{format_date_time(event.date, event.time)}',
+        f'SUMMARY:{escape_text(event.name)}',
+    ]
+    if event.category:
+        lines.append(f'CATEGORIES:{escape_text(event.category)}')
+    # Materialized series are stored row by row, each row is a VEVENT of its own
+    if event.is_recurring and not event.recurrence_materialized:
+        lines.extend(recurrence_lines(event))
+    lines.append('END:VEVENT')
+    return lines
+
+
+def build_calendar(host, batch_size=500):
+    """Render all events as an iCalendar document.
+
+    Virtually expanded series become one VEVENT with an RRULE or RDATE. Materialized
+    series are exported as their stored rows, so deleted or edited occurrences and
+    legacy rows without a series_id come out exactly as the calendar shows them.
+    """
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//PBA Solutions//Kalender//DE',
+        'CALSCALE:GREGORIAN',
+        'X-WR-CALNAME:Solutions Kalender',
+    ]
+    events = Event.query.order_by(Event.date, Event.id).yield_per(batch_size)
+    for event in events:
+        lines.extend(event_lines(event, host))
+    lines.append('END:VCALENDAR')
+    return ('\r\n'.join(fold_line(line) for line in lines) + '\r\n').encode('utf-8')
+
+
+def feed_window():
+    # Keyed on the widest possible window, so every write invalidates the feed
+    return date.min, date.max
@@ -0,0 +1,296 @@
+import csv
+import io
+import re
+from datetime import date, datetime, time, timedelta
+from itertools import chain, islice
+from time import perf_counter
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from models import db, Event
+from cache import events_cache
+from occurrence_index import index_events
+from recurrence import event_span
+from recurrence_generator import rule_ordinals
+
+IMPORT_FORMATS = ('csv', 'ics')
+RECURRENCE_TYPES = ('daily', 'weekly', 'monthly', 'yearly', 'custom')
+CSV_COLUMNS = ('name', 'date', 'time', 'category', 'recurrence_type', 'recurrence_end_date',
+               'custom_recurrence_dates', 'rrule')
+REQUIRED_COLUMNS = ('name', 'date', 'time')
+# The form caps custom dates at 50, imported series may carry a full year of them
+MAX_CUSTOM_DATES = 366
+ICS_FREQUENCIES = {'DAILY': 'daily', 'WEEKLY': 'weekly', 'MONTHLY': 'monthly', 'YEARLY': 'yearly'}
+# Only found in the month-end clamping rules ical.build_calendar writes, the expansion already clamps
+ICS_CLAMPING_PARTS = {'BYMONTHDAY', 'BYSETPOS', 'BYMONTH'}
+DATE_LIST_SEPARATOR = re.compile(r'[;,\s]+')
+UTC = ZoneInfo('UTC')
+
+
+def detect_format(filename, declared=None):
+    import_format = (declared or filename.rsplit('.', 1)[-1]).lower()
+    if import_format not in IMPORT_FORMATS:
+        raise ValueError('Nur CSV- und ICS-Dateien können importiert werden')
+    return import_format
+
+
+def read_rows(stream, import_format):
+    """Yield (line number, raw field dict) from a binary stream, one entry per event."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    return parse_ics(text) if import_format == 'ics' else parse_csv(text)
+
+
+def parse_csv(lines):
+    header = next(lines, '')
+    # Spreadsheets set to German export with semicolons
+    delimiter = ';' if header.count(';') > header.count(',') else ','
+    reader = csv.DictReader(chain([header], lines), delimiter=delimiter)
+    columns = [column.strip().lower() for column in reader.fieldnames or []]
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise ValueError(f"CSV-Kopfzeile ohne Spalte(n): {', '.join(missing)}")
+    reader.fieldnames = columns
+    for row in reader:
+        yield reader.line_num, {column: (row.get(column) or '').strip() for column in CSV_COLUMNS}
+
+
+def unfold(lines):
+    """Join RFC 5545 continuation lines, yielding (number of the first physical line, content line)."""
+    current, start = None, 0
+    for number, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if current is not None and line[:1] in (' ', '\t'):
+            current += line[1:]
+            continue
+        if current is not None:
+            yield start, current
+        current, start = line, number
+    if current is not None:
+        yield start, current
+
+
+def unescape_text(value):
+    return re.sub(r'\\([\\;,nN])', lambda match: '\n' if match.group(1) in 'nN' else match.group(1), value)
+
+
+def ics_date_time(value):
+    """'20240131T093000Z' -> ('2024-01-31', '09:30:00'), all-day values start at midnight.
+
+    The wall-clock time is returned as written, see ics_timezone for the zone it is in.
+    """
+    value = value.strip()
+    day = f'{value[0:4]}-{value[4:6]}-{value[6:8]}'
+    if 'T' not in value:
+        return day, '00:00:00'
+    clock = value.split('T', 1)[1]
+    return day, f'{clock[0:2]}:{clock[2:4]}:{clock[4:6] or "00"}'
+
+
+def ics_timezone(value, tzid):
+    """'UTC' for values ending in Z, the TZID parameter otherwise, '' for floating local times."""
+    if value.strip().upper().endswith('Z'):
+        return 'UTC'
+    return tzid or ''
+
+
+def parse_ics(lines):
+    event, start = None, 0
+    for number, line in unfold(lines):
+        name, _, value = line.partition(':')
+        name, _, parameters = name.partition(';')
+        name = name.upper()
+        if name == 'BEGIN' and value.strip().upper() == 'VEVENT':
+            event, start = {}, number
+        elif name == 'END' and value.strip().upper() == 'VEVENT' and event is not None:
+            yield start, ics_fields(event)
+            event = None
+        elif event is not None:
+            event.setdefault(name, []).append(value)
+            # Kept apart from the value, so every other property reads as before
+            if name == 'DTSTART':
+                tzid = [part.partition('=')[2] for part in parameters.split(';') if part.upper().startswith('TZID=')]
+                event['DTSTART_TZID'] = [tzid[0].strip('"') if tzid else '']
+
+
+def ics_fields(event):
+    day, clock = ics_date_time(event['DTSTART'][0]) if 'DTSTART' in event else ('', '')
+    timezone = ics_timezone(event['DTSTART'][0], event['DTSTART_TZID'][0]) if 'DTSTART' in event else ''
+    categories = re.split(r'(?<!\\),', event['CATEGORIES'][0]) if 'CATEGORIES' in event else ['']
+    rdates = [ics_date_time(value)[0] for line in event.get('RDATE', []) for value in line.split(',') if value]
+    return {
+        'name': unescape_text(event.get('SUMMARY', [''])[0]).strip(),
+        'date': day,
+        'time': clock,
+        'category': unescape_text(categories[0]).strip(),
+        'recurrence_type': 'custom' if rdates and 'RRULE' not in event else '',
+        'recurrence_end_date': '',
+        'custom_recurrence_dates': ','.join(rdates) if 'RRULE' not in event else '',
+        'rrule': event.get('RRULE', [''])[0],
+        'timezone': timezone,
+    }
+
+
+def parse_date(value, field):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.strptime(value, '%d.%m.%Y').date()
+    except ValueError:
+        raise ValueError(f'{field}: ungültiges Datum {value!r}') from None
+
+
+def parse_rrule(value, first):
+    """Turn an RRULE into (recurrence_type, recurrence_end_date) for the rules the calendar supports."""
+    parts = {key.upper(): part for key, _, part in (item.partition('=') for item in value.split(';') if item)}
+    recurrence_type = ICS_FREQUENCIES.get(parts.pop('FREQ', '').upper())
+    if recurrence_type is None:
+        raise ValueError('RRULE: FREQ fehlt oder wird nicht unterstützt')
+    if parts.pop('INTERVAL', '1') != '1':
+        raise ValueError('RRULE: INTERVAL wird nicht unterstützt')
+    until, count = parts.pop('UNTIL', None), parts.pop('COUNT', None)
+    unsupported = sorted(set(parts) - ICS_CLAMPING_PARTS)
+    if unsupported:
+        raise ValueError(f"RRULE: {', '.join(unsupported)} wird nicht unterstützt")
+
+    if until:
+        return recurrence_type, parse_date(until[:8], 'UNTIL')
+    if count:
+        if not count.isdigit() or int(count) < 1:
+            raise ValueError(f'RRULE: ungültiges COUNT {count!r}')
+        # Enough room for count occurrences of any rule, yearly being the widest
+        last = first + timedelta(days=min(366 * int(count), (date.max - first).days))
+        ordinals = rule_ordinals(recurrence_type, first, last)
+        return recurrence_type, date.fromordinal(ordinals[min(int(count), len(ordinals)) - 1])
+    return recurrence_type, None
+
+
+def local_time(day, clock, timezone, local_zone):
+    """Move a wall-clock date and time from timezone into local_zone, the zone the calendar shows."""
+    try:
+        zone = UTC if timezone == 'UTC' else ZoneInfo(timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f'timezone: unbekannte Zeitzone {timezone!r}') from None
+    moved = datetime.combine(day, clock, tzinfo=zone).astimezone(local_zone)
+    return moved.date(), moved.time().replace(tzinfo=None)
+
+
+def validate_row(raw, local_zone=None):
+    """Check one raw row and return the column values for Event, raises ValueError with the reason.
+
+    Rows with a timezone (ICS times ending in Z or carrying a TZID) are converted to local_zone.
+    """
+    name = raw.get('name', '')
+    if not name:
+        raise ValueError('name fehlt')
+    if len(name) > 100:
+        raise ValueError('name ist länger als 100 Zeichen')
+    day = parse_date(raw.get('date', ''), 'date')
+    try:
+        clock = time.fromisoformat(raw.get('time', '')).replace(microsecond=0)
+    except ValueError:
+        raise ValueError(f"time: ungültige Uhrzeit {raw.get('time', '')!r}") from None
+    shift = timedelta(0)
+    if raw.get('timezone') and local_zone is not None:
+        local_day, clock = local_time(day, clock, raw['timezone'], local_zone)
+        day, shift = local_day, local_day - day
+    category = raw.get('category') or 'default'
+    if len(category) > 50:
+        raise ValueError('category ist länger als 50 Zeichen')
+
+    recurrence_type = (raw.get('recurrence_type') or '').lower() or None
+    end_date = parse_date(raw['recurrence_end_date'], 'recurrence_end_date') if raw.get('recurrence_end_date') else None
+    if raw.get('rrule'):
+        recurrence_type, end_date = parse_rrule(raw['rrule'], day)
+    if recurrence_type is not None and recurrence_type not in RECURRENCE_TYPES:
+        raise ValueError(f'recurrence_type: unbekannter Typ {recurrence_type!r}')
+    if end_date is not None and end_date < day:
+        raise ValueError('recurrence_end_date liegt vor date')
+
+    custom_dates = None
+    if raw.get('custom_recurrence_dates'):
+        values = [value for value in DATE_LIST_SEPARATOR.split(raw['custom_recurrence_dates']) if value]
+        if len(values) > MAX_CUSTOM_DATES:
+            raise ValueError(f'Zu viele benutzerdefinierte Wiederholungsdaten. Maximal {MAX_CUSTOM_DATES} erlaubt.')
+        # RDATEs share DTSTART's time, so they move to the same local day
+        custom_dates = [parse_date(value, 'custom_recurrence_dates') + shift for value in values]
+    if recurrence_type == 'custom' and not custom_dates:
+        raise ValueError('custom_recurrence_dates fehlt für recurrence_type custom')
+
+    return {
+        'name': name,
+        'date': day,
+        'time': clock,
+        'category': category,
+        'is_recurring': recurrence_type is not None,
+        'recurrence_type': recurrence_type,
+        'recurrence_end_date': end_date,
+        'custom_recurrence_dates': custom_dates,
+    }
+
+
+def existing_keys(keys):
+    """(name, date, time) keys of the batch that are already stored, one query per batch."""
+    if not keys:
+        return set()
+    return {tuple(row) for row in db.session.execute(
+        db.select(Event.name, Event.date, Event.time).where(db.tuple_(Event.name, Event.date, Event.time).in_(keys))
+    )}
+
+
+def import_rows(rows, batch_size=500, expand_series=None, dry_run=False, timezone='Europe/Berlin'):
+    """Validate, deduplicate and insert (line, raw) rows in batches, one transaction per batch.
+
+    expand_series is called for every imported recurring event when series are materialized.
+    timezone is the zone the calendar's times are in, UTC and TZID times are converted to it.
+    Returns a report with row counts, per-row errors and the throughput.
+    """
+    report = {'rows': 0, 'imported': 0, 'duplicates': 0, 'errors': [], 'batches': 0}
+    started = perf_counter()
+    seen = set()
+    rows = iter(rows)
+    local_zone = ZoneInfo(timezone)
+
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        report['rows'] += len(batch)
+        valid = []
+        for line, raw in batch:
+            try:
+                values = validate_row(raw, local_zone)
+            except ValueError as error:
+                report['errors'].append({'line': line, 'error': str(error)})
+                continue
+            key = (values['name'], values['date'], values['time'])
+            if key in seen:
+                report['duplicates'] += 1
+                continue
+            seen.add(key)
+            valid.append(values)
+
+        stored = existing_keys([(values['name'], values['date'], values['time']) for values in valid])
+        new_rows = [values for values in valid if (values['name'], values['date'], values['time']) not in stored]
+        report['duplicates'] += len(valid) - len(new_rows)
+        report['imported'] += len(new_rows)
+        if not new_rows or dry_run:
+            continue
+
+        # Multi-row INSERT ... RETURNING hands back the new rows for the day index
+        events = db.session.scalars(db.insert(Event).returning(Event), new_rows).all()
+        index_events(events)
+        # The commit expires the returned rows, read what is needed first instead of one SELECT per row
+        spans = [event_span(event) for event in events]
+        series = [event for event in events if event.is_recurring and event.recurrence_type]
+        db.session.commit()
+        report['batches'] += 1
+        if expand_series is not None:
+            for event in series:
+                expand_series(event)
+        events_cache.invalidate(min(span[0] for span in spans), max(span[1] for span in spans))
+
+    if dry_run:
+        db.session.rollback()
+    report['seconds'] = perf_counter() - started
+    report['rows_per_second'] = report['rows'] / report['seconds'] if report['seconds'] else None
+    return report
@@ -0,0 +1,227 @@
+import hmac
+import logging
+import os
+import threading
+import time
+from flask import current_app, g, request, jsonify, has_request_context, before_render_template, template_rendered
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+from cache import events_cache
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger('calendar.requests')
+
+
+class Histogram:
+    def __init__(self):
+        self.bucket_counts = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.bucket_counts[index] += 1
+
+
+class Instrumentation:
+    """Per-endpoint latency, SQL, response size and template timings for the current worker process."""
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.latency = {}
+        self.endpoints = {}
+        self.templates = {}
+        # Connections of this process checked out of the SQLAlchemy pool, now and at most so far
+        self.pool = {'in_use': 0, 'peak_in_use': 0, 'checkouts': 0}
+        self.started_at = time.time()
+        self.startup_seconds = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', os.environ.get('METRICS_ENABLED', 'true').lower() == 'true')
+        # Scrapers send it as a bearer token, without one only logged-in users can read /metrics
+        app.config.setdefault('METRICS_TOKEN', os.environ.get('METRICS_TOKEN'))
+        app.config.setdefault('SERVER_TIMING', os.environ.get('SERVER_TIMING', 'false').lower() == 'true')
+        app.extensions['instrumentation'] = self
+        if not app.config['METRICS_ENABLED']:
+            return
+
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        before_render_template.connect(self.start_template, app)
+        template_rendered.connect(self.finish_template, app)
+        if not event.contains(Engine, 'before_cursor_execute', self.before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+        if not event.contains(Pool, 'checkout', self.pool_checkout):
+            event.listen(Pool, 'checkout', self.pool_checkout)
+            event.listen(Pool, 'checkin', self.pool_checkin)
+
+        app.add_url_rule('/metrics', 'metrics', self.prometheus_view)
+        app.add_url_rule('/metrics.json', 'metrics_json', self.json_view)
+
+    def record_startup(self, seconds):
+        self.startup_seconds = seconds
+
+    def start_request(self):
+        g.request_metrics = {'started': time.perf_counter(), 'queries': 0, 'sql_seconds': 0.0, 'templates': []}
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'request_metrics' in g:
+            conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'request_metrics' in g and conn.info.get('query_started'):
+            g.request_metrics['queries'] += 1
+            g.request_metrics['sql_seconds'] += time.perf_counter() - conn.info['query_started'].pop()
+
+    def pool_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self.lock:
+            self.pool['in_use'] += 1
+            self.pool['checkouts'] += 1
+            self.pool['peak_in_use'] = max(self.pool['peak_in_use'], self.pool['in_use'])
+
+    def pool_checkin(self, dbapi_connection, connection_record):
+        with self.lock:
+            self.pool['in_use'] = max(self.pool['in_use'] - 1, 0)
+
+    def pool_stats(self):
+        # SQLAlchemy's QueuePool defaults apply when gunicorn.conf.py did not size the pool
+        options = current_app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+        with self.lock:
+            return dict(self.pool, size=options.get('pool_size', 5), max_overflow=options.get('max_overflow', 10))
+
+    def start_template(self, app, template, context, **extra):
+        if 'request_metrics' in g:
+            g.request_metrics['template_started'] = time.perf_counter()
+
+    def finish_template(self, app, template, context, **extra):
+        if 'request_metrics' in g and 'template_started' in g.request_metrics:
+            elapsed = time.perf_counter() - g.request_metrics.pop('template_started')
+            g.request_metrics['templates'].append((template.name, elapsed))
+
+    def finish_request(self, response):
+        metrics = g.pop('request_metrics', None)
+        if metrics is None:
+            return response
+        elapsed = time.perf_counter() - metrics['started']
+        endpoint = request.endpoint or 'unmatched'
+        size = response.content_length or 0
+        template_seconds = sum(seconds for _, seconds in metrics['templates'])
+
+        with self.lock:
+            self.latency.setdefault((endpoint, request.method), Histogram()).observe(elapsed)
+            totals = self.endpoints.setdefault(endpoint, {
+                'requests': 0, 'queries': 0, 'sql_seconds': 0.0, 'response_bytes': 0, 'template_seconds': 0.0})
+            totals['requests'] += 1
+            totals['queries'] += metrics['queries']
+            totals['sql_seconds'] += metrics['sql_seconds']
+            totals['response_bytes'] += size
+            totals['template_seconds'] += template_seconds
+            for name, seconds in metrics['templates']:
+                rendered = self.templates.setdefault(name, {'renders': 0, 'seconds': 0.0})
+                rendered['renders'] += 1
+                rendered['seconds'] += seconds
+
+        logger.debug('%s %s %s %.1fms %d queries (%.1fms sql) %d bytes', request.method, request.path,
+                     response.status_code, elapsed * 1000, metrics['queries'], metrics['sql_seconds'] * 1000, size)
+        if current_app.config['SERVER_TIMING']:
+            response.headers['Server-Timing'] = (
+                f'db;dur={metrics["sql_seconds"] * 1000:.1f};desc="{metrics["queries"]} queries", '
+                f'tpl;dur={template_seconds * 1000:.1f}, total;dur={elapsed * 1000:.1f}'
+            )
+        return response
+
+    def snapshot(self):
+        pool = self.pool_stats()
+        with self.lock:
+            return {
+                'pid': os.getpid(),
+                'uptime_seconds': time.time() - self.started_at,
+                'startup_seconds': self.startup_seconds,
+                'endpoints': {
+                    endpoint: dict(totals, latency={
+                        method: {
+                            'count': histogram.count,
+                            'sum_seconds': histogram.total,
+                            'buckets': dict(zip(LATENCY_BUCKETS, histogram.bucket_counts)),
+                        }
+                        for (name, method), histogram in self.latency.items() if name == endpoint
+                    })
+                    for endpoint, totals in self.endpoints.items()
+                },
+                'templates': {name: dict(rendered) for name, rendered in self.templates.items()},
+                'events_cache': events_cache.stats(),
+                'db_pool': pool,
+            }
+
+    def authorized(self):
+        token = current_app.config['METRICS_TOKEN']
+        if token and hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+            return True
+        return current_user.is_authenticated
+
+    def unauthorized(self):
+        return jsonify({'error': 'Anmeldung erforderlich'}), 401, {'WWW-Authenticate': 'Bearer realm="metrics"'}
+
+    def json_view(self):
+        if not self.authorized():
+            return self.unauthorized()
+        return jsonify(self.snapshot())
+
+    def prometheus_view(self):
+        if not self.authorized():
+            return self.unauthorized()
+        lines = [
+            '# HELP calendar_request_duration_seconds Request latency by endpoint.',
+            '# TYPE calendar_request_duration_seconds histogram',
+        ]
+        with self.lock:
+            for (endpoint, method), histogram in sorted(self.latency.items()):
+                labels = f'endpoint="{endpoint}",method="{method}"'
+                for bound, count in zip(LATENCY_BUCKETS, histogram.bucket_counts):
+                    lines.append(f'calendar_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'calendar_request_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f'calendar_request_duration_seconds_sum{{{labels}}} {histogram.total}')
+                lines.append(f'calendar_request_duration_seconds_count{{{labels}}} {histogram.count}')
+
+            counters = (
+                ('calendar_sql_queries_total', 'queries', 'SQL statements executed while serving requests.'),
+                ('calendar_sql_seconds_total', 'sql_seconds', 'Time spent in SQL statements.'),
+                ('calendar_response_bytes_total', 'response_bytes', 'Bytes sent in response bodies of known length.'),
+                ('calendar_template_seconds_total', 'template_seconds', 'Time spent rendering templates.'),
+            )
+            for metric, key, description in counters:
+                lines.append(f'# HELP {metric} {description}')
+                lines.append(f'# TYPE {metric} counter')
+                for endpoint, totals in sorted(self.endpoints.items()):
+                    lines.append(f'{metric}{{endpoint="{endpoint}"}} {totals[key]}')
+
+        if self.startup_seconds is not None:
+            lines.append('# HELP calendar_startup_seconds Time create_app took in this worker.')
+            lines.append('# TYPE calendar_startup_seconds gauge')
+            lines.append(f'calendar_startup_seconds {self.startup_seconds}')
+
+        pool = self.pool_stats()
+        lines.append('# HELP calendar_db_pool_connections Pooled database connections of this worker.')
+        lines.append('# TYPE calendar_db_pool_connections gauge')
+        for state in ('in_use', 'peak_in_use', 'size', 'max_overflow'):
+            lines.append(f'calendar_db_pool_connections{{state="{state}"}} {pool[state]}')
+        lines.append('# TYPE calendar_db_pool_checkouts_total counter')
+        lines.append(f'calendar_db_pool_checkouts_total {pool["checkouts"]}')
+
+        cache_stats = events_cache.stats()
+        for key in ('hits', 'misses', 'invalidations'):
+            lines.append(f'# TYPE calendar_events_cache_{key}_total counter')
+            lines.append(f'calendar_events_cache_{key}_total {cache_stats[key]}')
+        return '\n'.join(lines) + '\n', 200, {'Content-Type': 'text/plain; version=0.0.4'}
+
+
+instrumentation = Instrumentation()
@@ -0,0 +1,120 @@
+"""Background jobs stored in the jobs table.
+
+Request handlers hand slow writes to submit(). With JOBS_MODE=inline (the
+default) the job runs right away inside the request, as before. With
+JOBS_MODE=queue it is only stored, the request returns at once and a
+`flask jobs worker` process runs it. Workers claim jobs with
+SELECT ... FOR UPDATE SKIP LOCKED, so any number of them can share the table
+without picking the same job twice. Clients poll /jobs/<id> for the outcome.
+"""
+import logging
+import time
+from datetime import datetime
+from flask import current_app
+from models import db, Job
+
+# kind -> function called with the job payload as keyword arguments, returns the JSON result
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    def register(function):
+        JOB_HANDLERS[kind] = function
+        return function
+    return register
+
+
+def submit(kind, **payload):
+    """Store a job and, in inline mode, run it before returning."""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f'Unbekannter Auftragstyp {kind!r}')
+    job = Job(kind=kind, payload=payload, status='queued', attempts=0)
+    db.session.add(job)
+    db.session.commit()
+    if current_app.config['JOBS_MODE'] == 'inline':
+        start_job(job)
+        run_job(job)
+    return job
+
+
+def start_job(job):
+    job.status = 'running'
+    job.started_at = datetime.utcnow()
+    job.attempts += 1
+    db.session.commit()
+
+
+def claim_job():
+    """Mark the oldest queued job as running and return it, None when the queue is empty."""
+    job = db.session.scalars(
+        db.select(Job).where(Job.status == 'queued').order_by(Job.id).limit(1).with_for_update(skip_locked=True)
+    ).first()
+    if job is None:
+        db.session.rollback()
+        return None
+    # The commit releases the row lock, the running status keeps other workers away from then on
+    start_job(job)
+    return job
+
+
+def run_job(job):
+    """Run a claimed job and record its result or error."""
+    job_id, kind = job.id, job.kind
+    started = time.perf_counter()
+    try:
+        result = JOB_HANDLERS[kind](**job.payload)
+    except Exception as error:
+        db.session.rollback()
+        logging.exception(f"Job {job_id} ({kind}) failed")
+        job = db.session.get(Job, job_id)
+        job.status, job.error = 'failed', str(error)
+    else:
+        job = db.session.get(Job, job_id)
+        job.status, job.result = 'done', result
+        logging.info(f"Job {job_id} ({kind}) done in {time.perf_counter() - started:.2f}s")
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    return job
+
+
+def work(poll_interval=1.0, burst=False, should_stop=lambda: False):
+    """Process jobs until should_stop() returns true, or the queue is empty in burst mode.
+
+    Returns the number of jobs run.
+    """
+    processed = 0
+    while not should_stop():
+        job = claim_job()
+        if job is None:
+            if burst:
+                break
+            time.sleep(poll_interval)
+            continue
+        run_job(job)
+        processed += 1
+    return processed
+
+
+def job_counts():
+    return dict(db.session.execute(db.select(Job.status, db.func.count()).group_by(Job.status)).all())
+
+
+def purge_jobs(older_than):
+    """Delete finished jobs older than the timedelta older_than, returns the number deleted."""
+    deleted = db.session.execute(
+        db.delete(Job).where(Job.status.in_(('done', 'failed')), Job.finished_at < datetime.utcnow() - older_than),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    db.session.commit()
+    return deleted
+
+
+def requeue_stale(older_than):
+    """Put jobs back in the queue that have been running longer than older_than, e.g. after a worker crash."""
+    requeued = db.session.execute(
+        db.update(Job).where(Job.status == 'running', Job.started_at < datetime.utcnow() - older_than)
+        .values(status='queued', started_at=None),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    db.session.commit()
+    return requeued
@@ -0,0 +1,28 @@
+"""Add date window indexes to events
+
+Revision ID: 4d2f8a61c5e7
+Revises: b7c1e4a2d903
+Create Date: 2026-10-18 10:03:17.558120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d2f8a61c5e7'
+down_revision = 'b7c1e4a2d903'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('events', schema=None) as batch_op:
+        batch_op.create_index('ix_events_date_time', ['date', 'time'], unique=False)
+        batch_op.create_index('ix_events_category_date', ['category', 'date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('events', schema=None) as batch_op:
+        batch_op.drop_index('ix_events_category_date')
+        batch_op.drop_index('ix_events_date_time')
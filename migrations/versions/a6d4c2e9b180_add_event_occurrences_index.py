@@ -0,0 +1,37 @@
+"""Add event_occurrences day index
+
+Revision ID: a6d4c2e9b180
+Revises: e81b6d3f2a59
+Create Date: 2026-10-18 15:02:47.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d4c2e9b180'
+down_revision = 'e81b6d3f2a59'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled by `flask occurrences rebuild`, which `flask init-db` runs after this migration
+    op.create_table(
+        'event_occurrences',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('time', sa.Time(), nullable=False),
+        sa.Column('event_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['event_id'], ['events.id'], name='fk_event_occurrences_event_id_events',
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('day', 'time', 'event_id', name='pk_event_occurrences')
+    )
+    with op.batch_alter_table('event_occurrences', schema=None) as batch_op:
+        batch_op.create_index('ix_event_occurrences_event_id', ['event_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('event_occurrences', schema=None) as batch_op:
+        batch_op.drop_index('ix_event_occurrences_event_id')
+    op.drop_table('event_occurrences')
@@ -0,0 +1,29 @@
+"""Add recurrence_materialized flag to events
+
+Revision ID: b7c1e4a2d903
+Revises: f9dd6e8d8417
+Create Date: 2026-10-18 09:12:41.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7c1e4a2d903'
+down_revision = 'f9dd6e8d8417'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('events', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('recurrence_materialized', sa.Boolean(), nullable=True))
+
+    # Existing series already have one row per occurrence and must not be expanded again
+    op.execute("UPDATE events SET recurrence_materialized = is_recurring")
+
+
+def downgrade():
+    with op.batch_alter_table('events', schema=None) as batch_op:
+        batch_op.drop_column('recurrence_materialized')
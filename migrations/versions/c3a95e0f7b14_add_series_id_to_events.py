@@ -0,0 +1,30 @@
+"""Add series_id link from materialized occurrences to their master
+
+Revision ID: c3a95e0f7b14
+Revises: 4d2f8a61c5e7
+Create Date: 2026-10-18 11:26:02.913377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a95e0f7b14'
+down_revision = '4d2f8a61c5e7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('events', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('series_id', sa.Integer(), nullable=True))
+        batch_op.create_index('ix_events_series_id', ['series_id'], unique=False)
+        batch_op.create_foreign_key('fk_events_series_id_events', 'events', ['series_id'], ['id'], ondelete='SET NULL')
+
+
+def downgrade():
+    with op.batch_alter_table('events', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_events_series_id_events', type_='foreignkey')
+        batch_op.drop_index('ix_events_series_id')
+        batch_op.drop_column('series_id')
@@ -0,0 +1,30 @@
+"""Add events_version table for version based ETags
+
+Revision ID: d5e2a7c9f341
+Revises: c3f8b51d7e26
+Create Date: 2026-10-18 19:02:37.816204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5e2a7c9f341'
+down_revision = 'c3f8b51d7e26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'events_version',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('value', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('id', name='pk_events_version')
+    )
+    op.execute("INSERT INTO events_version (id, value) VALUES (1, 0)")
+
+
+def downgrade():
+    op.drop_table('events_version')
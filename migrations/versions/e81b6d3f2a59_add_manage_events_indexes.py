@@ -0,0 +1,29 @@
+"""Add keyset and name prefix indexes for manage_events
+
+Revision ID: e81b6d3f2a59
+Revises: c3a95e0f7b14
+Create Date: 2026-10-18 12:48:55.120934
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e81b6d3f2a59'
+down_revision = 'c3a95e0f7b14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('events', schema=None) as batch_op:
+        batch_op.create_index('ix_events_date_id', ['date', 'id'], unique=False)
+        batch_op.create_index('ix_events_name_prefix', ['name'], unique=False,
+                              postgresql_ops={'name': 'varchar_pattern_ops'})
+
+
+def downgrade():
+    with op.batch_alter_table('events', schema=None) as batch_op:
+        batch_op.drop_index('ix_events_name_prefix')
+        batch_op.drop_index('ix_events_date_id')
@@ -1,10 +1,31 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from datetime import datetime, date
 from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.types import TypeDecorator
 from flask_login import UserMixin
 
 db = SQLAlchemy()
 
+class DateArray(TypeDecorator):
+    """Native date array on PostgreSQL, comma separated ISO dates elsewhere (SQLite benchmarks)."""
+    impl = db.Text
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(ARRAY(db.Date))
+        return dialect.type_descriptor(db.Text())
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name == 'postgresql':
+            return value
+        return ','.join(day.isoformat() for day in value)
+
+    def process_result_value(self, value, dialect):
+        if value is None or dialect.name == 'postgresql':
+            return value
+        return [date.fromisoformat(day) for day in value.split(',') if day]
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -20,17 +41,27 @@ class Event(db.Model):
     is_recurring = db.Column(db.Boolean, default=False)
     recurrence_type = db.Column(db.String(20))
     recurrence_end_date = db.Column(db.Date)
-    custom_recurrence_dates = db.Column(ARRAY(db.Date))
+    custom_recurrence_dates = db.Column(DateArray)
+    recurrence_materialized = db.Column(db.Boolean, default=False)
+    # Set on rows written by create_recurring_events, points at the series master
+    series_id = db.Column(db.Integer, db.ForeignKey('events.id', ondelete='SET NULL'), index=True)
     category = db.Column(db.String(50), default='standard')
 
+    __table_args__ = (
+        db.Index('ix_events_date_time', 'date', 'time'),
+        db.Index('ix_events_category_date', 'category', 'date'),
+        db.Index('ix_events_date_id', 'date', 'id'),
+        db.Index('ix_events_name_prefix', 'name', postgresql_ops={'name': 'varchar_pattern_ops'}),
+    )
+
     def __repr__(self):
         return f'<Termin {self.name}>'
 
-    def to_dict(self):
+    def to_dict(self, occurrence_date=None):
         return {
             'id': self.id,
             'name': self.name,
-            'date': self.date.isoformat(),
+            'date': (occurrence_date or self.date).isoformat(),
             'time': self.time.isoformat(),
             'is_recurring': self.is_recurring,
             'recurrence_type': self.recurrence_type,
@@ -38,3 +69,50 @@ class Event(db.Model):
             'custom_recurrence_dates': [date.isoformat() for date in self.custom_recurrence_dates] if self.custom_recurrence_dates else None,
             'category': self.category
         }
+
+class EventOccurrence(db.Model):
+    """One row per day an event appears on, kept in step with the events table by occurrence_index.py."""
+    __tablename__ = 'event_occurrences'
+    # Primary key order serves window reads as one range scan, already in calendar order
+    day = db.Column(db.Date, primary_key=True)
+    time = db.Column(db.Time, primary_key=True)
+    event_id = db.Column(db.Integer, db.ForeignKey('events.id', ondelete='CASCADE'), primary_key=True, index=True)
+
+class Job(db.Model):
+    """Background work queued by the web app and picked up by `flask jobs worker`, see jobs.py."""
+    __tablename__ = 'jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.JSON, nullable=False)
+    # queued -> running -> done or failed
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        # Workers claim the oldest queued job, an index scan in id order
+        db.Index('ix_jobs_status_id', 'status', 'id'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'attempts': self.attempts,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+class EventsVersion(db.Model):
+    """A single row counting the writes to the events table, the ETags of the window endpoints derive from it."""
+    __tablename__ = 'events_version'
+    id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
@@ -0,0 +1,141 @@
+from itertools import islice
+from flask import current_app
+from sqlalchemy.orm import load_only
+from models import db, Event, EventOccurrence
+from recurrence import occurrence_dates, summarize_window, WINDOW_COLUMNS
+
+INDEX_COLUMNS = WINDOW_COLUMNS + (Event.recurrence_materialized,)
+
+
+def index_days(event):
+    """Days the event is listed on by /events: every occurrence for virtual series, its own date otherwise."""
+    if event.is_recurring and not event.recurrence_materialized:
+        return occurrence_dates(event)
+    return [event.date]
+
+
+def index_rows(events):
+    return [
+        {'day': day, 'time': event.time, 'event_id': event.id}
+        for event in events
+        for day in index_days(event)
+    ]
+
+
+def index_enabled():
+    # With OCCURRENCE_INDEX off nothing reads the table, writes leave it alone until the next rebuild
+    return current_app.config['OCCURRENCE_INDEX']
+
+
+def unindex_events(event_ids):
+    """Drop the index rows of the given events, call before deleting them."""
+    if not index_enabled():
+        return
+    db.session.execute(
+        db.delete(EventOccurrence).where(EventOccurrence.event_id.in_(event_ids)),
+        execution_options={'synchronize_session': False}
+    )
+
+
+def index_events(events):
+    """Replace the index rows of flushed events within the caller's transaction."""
+    if not index_enabled():
+        return
+    events = list(events)
+    unindex_events([event.id for event in events])
+    rows = index_rows(events)
+    if rows:
+        db.session.execute(db.insert(EventOccurrence), rows)
+
+
+def index_series(series_id):
+    """Index the rows create_recurring_events wrote for a series with one INSERT ... SELECT."""
+    if not index_enabled():
+        return
+    db.session.execute(db.insert(EventOccurrence).from_select(
+        ['day', 'time', 'event_id'],
+        db.select(Event.date, Event.time, Event.id).where(Event.series_id == series_id)
+    ))
+
+
+def index_window_query(start_date, end_date):
+    return db.select(EventOccurrence.day, Event).join(Event, Event.id == EventOccurrence.event_id).options(
+        load_only(*WINDOW_COLUMNS)
+    ).where(
+        EventOccurrence.day.between(start_date, end_date)
+    ).order_by(EventOccurrence.day, EventOccurrence.time, EventOccurrence.event_id)
+
+
+def indexed_events_in_window(start_date, end_date):
+    """Same (date, event) pairs as recurrence.events_in_window, read from the day index instead."""
+    return [(day, event) for day, event in db.session.execute(index_window_query(start_date, end_date))]
+
+
+def index_summary_query(start_date, end_date):
+    return db.select(
+        EventOccurrence.day, Event.category, db.func.count(),
+        db.func.max(db.case((Event.is_recurring.is_(True), 1), else_=0))
+    ).join(Event, Event.id == EventOccurrence.event_id).where(
+        EventOccurrence.day.between(start_date, end_date)
+    ).group_by(EventOccurrence.day, Event.category)
+
+
+def indexed_window_summary(start_date, end_date):
+    """Same result as recurrence.window_summary, one GROUP BY over the day index."""
+    return summarize_window(db.session.execute(index_summary_query(start_date, end_date)).all())
+
+
+def iter_event_batches(batch_size):
+    events = db.session.scalars(
+        db.select(Event).options(load_only(*INDEX_COLUMNS)).order_by(Event.id).execution_options(yield_per=batch_size))
+    while True:
+        batch = list(islice(events, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def rebuild_index(batch_size=1000):
+    """Rewrite the whole index from the events table and return the number of rows written."""
+    db.session.execute(db.delete(EventOccurrence))
+    written = 0
+    for batch in iter_event_batches(batch_size):
+        rows = index_rows(batch)
+        if rows:
+            db.session.execute(db.insert(EventOccurrence), rows)
+        written += len(rows)
+    db.session.commit()
+    return written
+
+
+def verify_index(batch_size=1000, sample_size=10):
+    """Compare the index with a fresh expansion of the events table.
+
+    Returns {'events': n, 'rows': n, 'missing': [...], 'extra': [...]} where missing and extra
+    hold up to sample_size (day, time, event_id) tuples and the *_count keys their totals.
+    """
+    report = {'events': 0, 'rows': 0, 'missing': [], 'extra': [], 'missing_count': 0, 'extra_count': 0}
+
+    def record(kind, rows):
+        report[f'{kind}_count'] += len(rows)
+        report[kind].extend(sorted(rows)[:sample_size - len(report[kind])])
+
+    for batch in iter_event_batches(batch_size):
+        expected = {(row['day'], row['time'], row['event_id']) for row in index_rows(batch)}
+        actual = {tuple(row) for row in db.session.execute(
+            db.select(EventOccurrence.day, EventOccurrence.time, EventOccurrence.event_id)
+            .where(EventOccurrence.event_id.in_([event.id for event in batch]))
+        )}
+        report['events'] += len(batch)
+        report['rows'] += len(actual)
+        record('missing', expected - actual)
+        record('extra', actual - expected)
+
+    # Rows left behind by events deleted without going through unindex_events
+    orphans = {tuple(row) for row in db.session.execute(
+        db.select(EventOccurrence.day, EventOccurrence.time, EventOccurrence.event_id)
+        .outerjoin(Event, Event.id == EventOccurrence.event_id).where(Event.id.is_(None))
+    )}
+    report['rows'] += len(orphans)
+    record('extra', orphans)
+    return report
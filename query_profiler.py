@@ -0,0 +1,100 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from flask import current_app, g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('calendar.queries')
+
+# Budget violations kept for inspection, older ones are only counted
+MAX_VIOLATIONS = 100
+
+
+def parse_budgets(value):
+    """Turn 'get_events=3,manage_events=4' into {'get_events': 3, 'manage_events': 4}."""
+    budgets = {}
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        endpoint, limit = item.split('=')
+        budgets[endpoint.strip()] = int(limit)
+    return budgets
+
+
+class QueryProfiler:
+    """Opt-in per-request SQL profile that flags repeated statements (N+1) and slow queries."""
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.violations = deque(maxlen=MAX_VIOLATIONS)
+        self.violation_count = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('QUERY_PROFILER', os.environ.get('QUERY_PROFILER', 'false').lower() == 'true')
+        # Same statement this many times in one request counts as an N+1 pattern
+        app.config.setdefault('QUERY_REPEAT_THRESHOLD', int(os.environ.get('QUERY_REPEAT_THRESHOLD', 5)))
+        app.config.setdefault('QUERY_SLOW_MS', float(os.environ.get('QUERY_SLOW_MS', 100)))
+        app.config.setdefault('QUERY_BUDGETS', parse_budgets(os.environ.get('QUERY_BUDGETS')))
+        app.extensions['query_profiler'] = self
+        if not app.config['QUERY_PROFILER']:
+            return
+
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        if not event.contains(Engine, 'before_cursor_execute', self.before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+
+    def start_request(self):
+        g.query_profile = {}
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'query_profile' in g:
+            conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not (has_request_context() and 'query_profile' in g and conn.info.get('profile_started')):
+            return
+        elapsed = time.perf_counter() - conn.info['profile_started'].pop()
+        # Statements are already parameterized, identical text means the same query shape
+        entry = g.query_profile.setdefault(statement, {'count': 0, 'seconds': 0.0, 'slowest': 0.0})
+        entry['count'] += 1
+        entry['seconds'] += elapsed
+        entry['slowest'] = max(entry['slowest'], elapsed)
+
+    def finish_request(self, response):
+        profile = g.pop('query_profile', None)
+        if profile is None:
+            return response
+        config = current_app.config
+        endpoint = request.endpoint or 'unmatched'
+        total = sum(entry['count'] for entry in profile.values())
+        repeated = {statement: entry for statement, entry in profile.items()
+                    if entry['count'] >= config['QUERY_REPEAT_THRESHOLD']}
+        slow = {statement: entry for statement, entry in profile.items()
+                if entry['slowest'] * 1000 >= config['QUERY_SLOW_MS']}
+
+        for statement, entry in repeated.items():
+            logger.warning('N+1 in %s: %d x %s', endpoint, entry['count'], ' '.join(statement.split())[:200])
+        for statement, entry in slow.items():
+            logger.warning('Slow query in %s: %.1fms %s', endpoint, entry['slowest'] * 1000,
+                           ' '.join(statement.split())[:200])
+
+        budget = config['QUERY_BUDGETS'].get(endpoint)
+        if budget is not None and total > budget:
+            logger.warning('Query budget exceeded in %s: %d > %d', endpoint, total, budget)
+            with self.lock:
+                self.violations.append({'endpoint': endpoint, 'path': request.path, 'queries': total, 'budget': budget})
+                self.violation_count += 1
+
+        response.headers['X-Query-Profile'] = (
+            f'queries={total}; distinct={len(profile)}; repeated={len(repeated)}; slow={len(slow)}; '
+            f'sql_ms={sum(entry["seconds"] for entry in profile.values()) * 1000:.1f}'
+        )
+        return response
+
+
+query_profiler = QueryProfiler()
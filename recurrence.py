@@ -0,0 +1,177 @@
+import calendar
+import heapq
+from datetime import date, timedelta
+from sqlalchemy.orm import load_only
+from models import db, Event
+from recurrence_generator import rule_ordinals
+
+# Series without an end date repeat for one year, same as the materialized rows always did
+RECURRENCE_HORIZON = timedelta(days=365)
+SECONDS_PER_DAY = 86400
+
+# Everything Event.to_dict and the expansion need, created_at is left out
+WINDOW_COLUMNS = (
+    Event.id, Event.name, Event.date, Event.time, Event.is_recurring, Event.recurrence_type,
+    Event.recurrence_end_date, Event.custom_recurrence_dates, Event.category
+)
+
+
+def add_months(start, months):
+    month_index = start.month - 1 + months
+    year = start.year + month_index // 12
+    month = month_index % 12 + 1
+    # Clamp to the last day of shorter months (31.01. -> 29.02. -> 31.03.)
+    day = min(start.day, calendar.monthrange(year, month)[1])
+    return start.replace(year=year, month=month, day=day)
+
+
+def series_end(event):
+    if event.recurrence_type == 'custom':
+        return max([event.date] + list(event.custom_recurrence_dates or []))
+    return event.recurrence_end_date or (event.date + RECURRENCE_HORIZON)
+
+
+def event_span(event):
+    """First and last date an event (or its whole series) can appear on."""
+    if event.is_recurring and event.recurrence_type:
+        return event.date, series_end(event)
+    return event.date, event.date
+
+
+def series_ordinals(event, window_start=None, window_end=None):
+    """Day ordinals the event occurs on, starting with its own date, limited to the window."""
+    if not event.is_recurring:
+        return rule_ordinals(None, event.date, event.date, window_start, window_end)
+    return rule_ordinals(event.recurrence_type, event.date, series_end(event), window_start, window_end,
+                         event.custom_recurrence_dates)
+
+
+def occurrence_dates(event, window_start=None, window_end=None):
+    """Yield every date the event occurs on, starting with its own date, limited to the window."""
+    for ordinal in series_ordinals(event, window_start, window_end):
+        yield date.fromordinal(ordinal)
+
+
+def seconds_of_day(value):
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def virtual_series_filter():
+    return db.and_(Event.is_recurring.is_(True), Event.recurrence_materialized.isnot(True))
+
+
+def occurrence_sort_key(occurrence):
+    return occurrence[0], occurrence[1].time
+
+
+def series_occurrences(event, start_date, end_date):
+    for day in occurrence_dates(event, start_date, end_date):
+        yield day, event
+
+
+def window_series_query(start_date, end_date):
+    return db.select(Event).options(load_only(*WINDOW_COLUMNS)).where(
+        virtual_series_filter(),
+        Event.date <= end_date,
+        db.or_(
+            Event.recurrence_type == 'custom',
+            Event.recurrence_end_date >= start_date,
+            db.and_(Event.recurrence_end_date.is_(None), Event.date >= start_date - RECURRENCE_HORIZON)
+        )
+    )
+
+
+def window_single_events_query(start_date, end_date):
+    # Served by ix_events_date_time, rows already come back in calendar order
+    return db.select(Event).options(load_only(*WINDOW_COLUMNS)).where(
+        db.not_(virtual_series_filter()),
+        Event.date.between(start_date, end_date)
+    ).order_by(Event.date, Event.time)
+
+
+def merge_window(single_events, series, start_date, end_date):
+    """Merge date-ordered single events with the expanded occurrences of the series masters."""
+    if not series:
+        return [(event.date, event) for event in single_events]
+    # Each occurrence becomes one integer (day, time, position) so the whole window sorts natively.
+    # Positions keep the order of single_events and put them before series on ties.
+    events = list(single_events) + list(series)
+    width = len(events)
+    day_width = SECONDS_PER_DAY * width
+    keys = [
+        event.date.toordinal() * day_width + seconds_of_day(event.time) * width + position
+        for position, event in enumerate(single_events)
+    ]
+    for position, event in enumerate(series, len(keys)):
+        offset = seconds_of_day(event.time) * width + position
+        keys.extend([ordinal * day_width + offset for ordinal in series_ordinals(event, start_date, end_date)])
+    keys.sort()
+    if not keys:
+        return []
+
+    days = {ordinal: date.fromordinal(ordinal) for ordinal in range(keys[0] // day_width, keys[-1] // day_width + 1)}
+    return [(days[key // day_width], events[key % width]) for key in keys]
+
+
+def events_in_window(start_date, end_date):
+    """Return (date, event) pairs for all events in the window, expanding virtual series on the fly."""
+    single_events = db.session.scalars(window_single_events_query(start_date, end_date)).all()
+    series = db.session.scalars(window_series_query(start_date, end_date)).all()
+    return merge_window(single_events, series, start_date, end_date)
+
+
+def iter_events_in_window(start_date, end_date, batch_size=500):
+    """Like events_in_window, but streams rows through a server-side cursor and expands series lazily."""
+    # Series masters are few, load them before the row cursor is opened
+    series = db.session.scalars(window_series_query(start_date, end_date)).all()
+    single_events = db.session.scalars(
+        window_single_events_query(start_date, end_date).execution_options(yield_per=batch_size))
+    streams = [((event.date, event) for event in single_events)]
+    streams.extend(series_occurrences(event, start_date, end_date) for event in series)
+    return heapq.merge(*streams, key=occurrence_sort_key)
+
+
+def summary_single_events_query(start_date, end_date):
+    # GROUP BY date, category over the ix_events_date_time range, series are added in Python
+    return db.select(
+        Event.date, Event.category, db.func.count(Event.id),
+        db.func.max(db.case((Event.is_recurring.is_(True), 1), else_=0))
+    ).where(
+        db.not_(virtual_series_filter()),
+        Event.date.between(start_date, end_date)
+    ).group_by(Event.date, Event.category)
+
+
+def summarize_window(rows, series=(), start_date=None, end_date=None):
+    """Per-day counts by category and a recurring flag: ISO date -> {'categories': {...}, 'recurring': bool}.
+
+    rows are (date, category, count, recurring) tuples from a GROUP BY query, the virtual
+    series are expanded into the same shape without building an object per occurrence.
+    """
+    days = {}
+    for day, category, count, recurring in rows:
+        summary = days.setdefault(day.toordinal(), {'categories': {}, 'recurring': False})
+        category = category or 'default'
+        summary['categories'][category] = summary['categories'].get(category, 0) + count
+        summary['recurring'] = summary['recurring'] or bool(recurring)
+    for event in series:
+        category = event.category or 'default'
+        for ordinal in series_ordinals(event, start_date, end_date):
+            summary = days.setdefault(ordinal, {'categories': {}, 'recurring': False})
+            summary['categories'][category] = summary['categories'].get(category, 0) + 1
+            summary['recurring'] = True
+    return {date.fromordinal(ordinal).isoformat(): days[ordinal] for ordinal in sorted(days)}
+
+
+def window_summary(start_date, end_date):
+    rows = db.session.execute(summary_single_events_query(start_date, end_date)).all()
+    series = db.session.scalars(window_series_query(start_date, end_date)).all()
+    return summarize_window(rows, series, start_date, end_date)
+
+
+def group_by_date(occurrences):
+    """Shape (date, event) pairs like the /events response: ISO date -> list of event dicts."""
+    events_dict = {}
+    for occurrence_date, event in occurrences:
+        events_dict.setdefault(occurrence_date.isoformat(), []).append(event.to_dict(occurrence_date))
+    return events_dict
@@ -0,0 +1,96 @@
+"""Bulk occurrence generation on day ordinals.
+
+Every rule expands to a range of ordinals (daily, weekly) or to slices of a
+precomputed month table (monthly, yearly), so a series is produced in one go
+instead of stepping through dates one at a time. Monthly and yearly rules clamp
+to the month end: a series on the 31st falls on the 30th in April and on the
+28th or 29th in February. Inputs and outputs are plain ``date.toordinal()``
+integers, callers convert at the edges.
+"""
+import calendar
+from datetime import date
+
+TABLE_FIRST_YEAR = 1900
+TABLE_LAST_YEAR = 2199
+RULE_STEPS = {'daily': 1, 'weekly': 7, 'monthly': 1, 'yearly': 12}
+
+
+def month_index(day):
+    return day.year * 12 + day.month - 1
+
+
+def compute_month(index):
+    year, month = divmod(index, 12)
+    return date(year, month + 1, 1).toordinal(), calendar.monthrange(year, month + 1)[1]
+
+
+def build_month_table(first_year, last_year):
+    starts, lengths = [], []
+    for index in range(first_year * 12, (last_year + 1) * 12):
+        start, length = compute_month(index)
+        starts.append(start)
+        lengths.append(length)
+    return starts, lengths
+
+
+# Ordinal of the first day and number of days of every month from TABLE_FIRST_YEAR to TABLE_LAST_YEAR
+MONTH_STARTS, MONTH_LENGTHS = build_month_table(TABLE_FIRST_YEAR, TABLE_LAST_YEAR)
+TABLE_OFFSET = TABLE_FIRST_YEAR * 12
+
+
+def month_slice(first, last, step):
+    """First-day ordinals and lengths of months first, first + step, ... up to last (month indexes)."""
+    lower, upper = first - TABLE_OFFSET, last - TABLE_OFFSET
+    if 0 <= lower and upper < len(MONTH_STARTS):
+        return MONTH_STARTS[lower:upper + 1:step], MONTH_LENGTHS[lower:upper + 1:step]
+    months = [compute_month(index) for index in range(first, last + 1, step)]
+    return [start for start, _ in months], [length for _, length in months]
+
+
+def month_ordinals(first, step, lower, upper):
+    """Ordinals of a monthly (step 1) or yearly (step 12) series starting on date first, within [lower, upper]."""
+    origin = month_index(first)
+    # Month offsets of the first and last candidate, the clamped day can still fall outside the window
+    low_offset = max(0, -(-(month_index(date.fromordinal(lower)) - origin) // step))
+    high_offset = (month_index(date.fromordinal(upper)) - origin) // step
+    if low_offset > high_offset:
+        return []
+    starts, lengths = month_slice(origin + low_offset * step, origin + high_offset * step, step)
+    day = first.day
+    if day <= 28:
+        ordinals = [start + day - 1 for start in starts]
+    else:
+        ordinals = [start + (day if day <= length else length) - 1 for start, length in zip(starts, lengths)]
+    if ordinals and ordinals[0] < lower:
+        del ordinals[0]
+    if ordinals and ordinals[-1] > upper:
+        del ordinals[-1]
+    return ordinals
+
+
+def rule_ordinals(rule, first, last, lower=None, upper=None, custom_dates=None):
+    """Return the ordinals of every occurrence of a series as a sorted range or list.
+
+    rule is one of daily, weekly, monthly, yearly or custom, anything else yields only
+    first. first and last are the dates the series starts and ends on, lower and upper
+    optionally limit the result to a window. custom_dates are the extra dates of a
+    custom series, only those after first count.
+    """
+    first_ordinal = first.toordinal()
+    low = first_ordinal if lower is None else max(first_ordinal, lower.toordinal())
+    high = last.toordinal() if upper is None else min(last.toordinal(), upper.toordinal())
+    if low > high:
+        return []
+
+    if rule == 'custom':
+        ordinals = {first_ordinal} | {day.toordinal() for day in custom_dates or () if day > first}
+        return sorted(ordinal for ordinal in ordinals if low <= ordinal <= high)
+
+    step = RULE_STEPS.get(rule)
+    if step is None:
+        return [first_ordinal] if low <= first_ordinal <= high else []
+    if rule in ('daily', 'weekly'):
+        # Jump straight to the first occurrence inside the window
+        start = first_ordinal + -(-(low - first_ordinal) // step) * step
+        return range(start, high + 1, step)
+    return month_ordinals(first, step, low, high)
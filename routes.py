@@ -1,13 +1,26 @@
 import os
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session
-from models import db, Event, User
+import tempfile
+from flask import Flask, abort, current_app, g, render_template, send_from_directory, request, jsonify, redirect, url_for, flash, session, stream_with_context
+from models import db, Event, Job, User
+from recurrence import events_in_window, window_summary, iter_events_in_window, add_months, occurrence_dates, event_span, WINDOW_COLUMNS
+from cache import events_cache
+from auth import user_cache
+from events_version import bump_version, current_version, window_etag
+from ical import build_calendar, feed_window
+from occurrence_index import index_events, index_series, indexed_events_in_window, indexed_window_summary, unindex_events
+from importer import detect_format, import_rows, read_rows
+from jobs import job_handler, submit
+from snapshots import month_name, render_snapshots, snapshot_range
+from wire import WINDOW_MIMETYPES, cache_variant, compress, encode_summary, encode_window, negotiate
 from datetime import datetime, timedelta
+from itertools import groupby
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField
 from wtforms.validators import DataRequired
 from flask_wtf.csrf import generate_csrf
 from flask_login import login_user, login_required, logout_user, current_user
 from werkzeug.security import check_password_hash, generate_password_hash
+from sqlalchemy.orm import load_only
 import logging
 
 class LoginForm(FlaskForm):
@@ -15,50 +28,125 @@ class LoginForm(FlaskForm):
     password = PasswordField('Password', validators=[DataRequired()])
 
 def create_recurring_events(event):
+    """Materialize every occurrence of a recurring event and return the number of rows written."""
     if not event.is_recurring or not event.recurrence_type:
-        return
-
-    end_date = event.recurrence_end_date or (event.date + timedelta(days=365))
-    current_date = event.date
-
-    while current_date <= end_date:
-        if event.recurrence_type == 'daily':
-            current_date += timedelta(days=1)
-        elif event.recurrence_type == 'weekly':
-            current_date += timedelta(weeks=1)
-        elif event.recurrence_type == 'monthly':
-            current_date = current_date.replace(month=current_date.month % 12 + 1)
-            if current_date.month == 1:
-                current_date = current_date.replace(year=current_date.year + 1)
-        elif event.recurrence_type == 'yearly':
-            current_date = current_date.replace(year=current_date.year + 1)
-        elif event.recurrence_type == 'custom':
-            if event.custom_recurrence_dates:
-                for custom_date in event.custom_recurrence_dates:
-                    if custom_date > event.date:
-                        new_event = Event(
-                            name=event.name,
-                            date=custom_date,
-                            time=event.time,
-                            is_recurring=False,
-                            category=event.category
-                        )
-                        db.session.add(new_event)
-            break
-
-        if current_date <= end_date and current_date != event.date:
-            new_event = Event(
-                name=event.name,
-                date=current_date,
-                time=event.time,
-                is_recurring=False,
-                category=event.category
-            )
-            db.session.add(new_event)
+        return 0
 
+    rows = [
+        {
+            'name': event.name,
+            'date': occurrence_date,
+            'time': event.time,
+            'is_recurring': False,
+            'category': event.category,
+            'series_id': event.id
+        }
+        for occurrence_date in occurrence_dates(event)
+        if occurrence_date != event.date
+    ]
+    event.recurrence_materialized = True
+    # A list of parameter sets runs as one executemany (batched multi-row VALUES on PostgreSQL)
+    if rows:
+        db.session.execute(db.insert(Event), rows)
+    # The master now only stands for its own date, the occurrences are rows of their own
+    db.session.flush()
+    index_events([event])
+    index_series(event.id)
     db.session.commit()
+    logging.info(f"Materialized {len(rows)} occurrences for event {event.id}")
+    return len(rows)
+
+@job_handler('expand_series')
+def expand_series(event_id):
+    event = db.session.get(Event, event_id)
+    # Deleted or already expanded while the job was waiting
+    if event is None or event.recurrence_materialized:
+        return {'created': 0}
+    created = create_recurring_events(event)
+    events_cache.invalidate(*event_span(event))
+    return {'created': created}
+
+@job_handler('delete_events')
+def delete_events(event_ids):
+    """Delete events together with their index rows and cached windows."""
+    spans = [
+        event_span(event)
+        for event in Event.query.options(load_only(*WINDOW_COLUMNS)).filter(Event.id.in_(event_ids))
+    ]
+    unindex_events(event_ids)
+    db.session.execute(
+        db.delete(Event).where(Event.id.in_(event_ids)),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+    if spans:
+        events_cache.invalidate(min(span[0] for span in spans), max(span[1] for span in spans))
+    return {'deleted': len(spans)}
+
+@job_handler('import_events')
+def import_file(path, import_format, filename, dry_run=False):
+    """Import a stored upload and remove it once the import succeeded, returns the import report."""
+    expand = create_recurring_events if current_app.config['RECURRENCE_MODE'] == 'materialize' else None
+    with open(path, 'rb') as handle:
+        report = import_rows(read_rows(handle, import_format), batch_size=current_app.config['IMPORT_BATCH_SIZE'],
+                             expand_series=expand, dry_run=dry_run, timezone=current_app.config['IMPORT_TIMEZONE'])
+    # A failed import keeps its upload, so a requeued job can run it again
+    os.remove(path)
+    logging.info(f"Imported {report['imported']} of {report['rows']} rows from {filename} "
+                 f"({report['rows_per_second'] or 0:.0f} rows/s)")
+    return report
+
+def save_upload(upload, import_format):
+    """Store an uploaded file where the job worker can read it and return its path."""
+    upload_dir = current_app.config['IMPORT_UPLOAD_DIR']
+    os.makedirs(upload_dir, exist_ok=True)
+    handle, path = tempfile.mkstemp(suffix=f'.{import_format}', dir=upload_dir)
+    with os.fdopen(handle, 'wb') as stored:
+        upload.save(stored)
+    return path
+
+def set_cache_policy(response, max_age):
+    # Admins must see their own edits right away, anonymous embed viewers may reuse a copy
+    if current_user.is_authenticated:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    else:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    return response
+
+def request_version():
+    # Read once per request, the ETag and every cache lookup of the request use the same version
+    if 'events_version' not in g:
+        g.events_version = current_version()
+    return g.events_version
+
+def fetch_window(start_date, end_date, build, variant):
+    """Return the ETag and body of a window, the body is empty when If-None-Match already matches.
+
+    make_conditional turns the empty body into a 304, the window is neither loaded nor looked up.
+    """
+    version = request_version()
+    etag = window_etag(version, variant, start_date, end_date)
+    if etag in request.if_none_match:
+        return etag, b''
+    return etag, events_cache.fetch(start_date, end_date, build, variant=variant, version=version)
+
+def window_response(app, etag, body, window_format, encoding):
+    response = app.response_class(body, mimetype=WINDOW_MIMETYPES[window_format])
+    if encoding:
+        response.content_encoding = encoding
+    response.vary.update(('Accept', 'Accept-Encoding'))
+    response.set_etag(etag)
+    set_cache_policy(response, app.config['EVENTS_MAX_AGE'])
+    return response.make_conditional(request)
 
 def init_routes(app):
+    events_cache.on_invalidate(bump_version)
+    # Both return (date, event) pairs in calendar order
+    load_window = indexed_events_in_window if app.config['OCCURRENCE_INDEX'] else events_in_window
+    load_summary = indexed_window_summary if app.config['OCCURRENCE_INDEX'] else window_summary
+
     @app.route('/')
     def index():
         view = request.args.get('view', 'month')
@@ -100,6 +188,8 @@ def init_routes(app):
             new_password = request.form['new_password']
             confirm_password = request.form['confirm_password']
             
+            # The cached copy may predate a change made through another worker
+            db.session.refresh(current_user._get_current_object())
             if not check_password_hash(current_user.password, current_password):
                 flash('Aktuelles Passwort ist falsch', 'danger')
             elif new_password != confirm_password:
@@ -107,6 +197,7 @@ def init_routes(app):
             else:
                 current_user.password = generate_password_hash(new_password)
                 db.session.commit()
+                user_cache.invalidate(current_user.id)
                 flash('Passwort erfolgreich geändert', 'success')
                 return redirect(url_for('index'))
         
@@ -115,12 +206,36 @@ def init_routes(app):
     @app.route('/child_embed')
     def child_embed():
         view = request.args.get('view', 'month')
-        return render_template('child_embed.html', embedded=True, view=view)
+        response = app.make_response(render_template('child_embed.html', embedded=True, view=view))
+        response.add_etag()
+        set_cache_policy(response, app.config['EMBED_MAX_AGE'])
+        return response.make_conditional(request)
+
+    @app.route('/embed/snapshot/<name>')
+    def embed_snapshot(name):
+        if not app.config['EMBED_SNAPSHOTS']:
+            abort(404)
+        try:
+            month = datetime.now().date().replace(day=1) if name == 'current' else datetime.strptime(name, '%Y-%m').date()
+        except ValueError:
+            abort(404)
+        first, last = snapshot_range()
+        if not first <= month <= last:
+            abort(404)
+        filename = f'{month_name(month)}.html'
+        # Months that entered the range since the last full render
+        if not os.path.exists(os.path.join(app.config['EMBED_SNAPSHOT_DIR'], filename)):
+            render_snapshots(month, month)
+        return send_from_directory(app.config['EMBED_SNAPSHOT_DIR'], filename,
+                                   max_age=app.config['EMBED_SNAPSHOT_MAX_AGE'])
 
     @app.route('/embed')
     def embed():
         view = request.args.get('view', 'month')
-        child_embed_url = request.url_root.rstrip('/') + url_for('child_embed')
+        if app.config['EMBED_SNAPSHOTS'] and view == 'month':
+            child_embed_url = request.url_root.rstrip('/') + url_for('embed_snapshot', name='current')
+        else:
+            child_embed_url = request.url_root.rstrip('/') + url_for('child_embed')
         iframe_code = f'<iframe src="{child_embed_url}" width="100%" height="600" frameborder="0"></iframe>'
         return render_template('embed.html', view=view, iframe_code=iframe_code)
 
@@ -159,13 +274,28 @@ def init_routes(app):
                     new_event.custom_recurrence_dates = [datetime.strptime(date_str, '%Y-%m-%d').date() for date_str in date_strings]
                     logging.info(f"Parsed Custom Recurrence Dates: {new_event.custom_recurrence_dates}")
 
+                expand = is_recurring and app.config['RECURRENCE_MODE'] == 'materialize'
                 db.session.add(new_event)
+                db.session.flush()
+                # An inline expansion indexes the series itself, a queued one is indexed like a virtual
+                # series until it has run
+                if not (expand and app.config['JOBS_MODE'] == 'inline'):
+                    index_events([new_event])
                 db.session.commit()
 
-                if is_recurring:
-                    create_recurring_events(new_event)
-
-                flash('Termin erfolgreich hinzugefügt', 'success')
+                # Virtual series are expanded per request in /events, only the master row is stored
+                if expand:
+                    # Until a queued expansion has run the series is listed like a virtual one
+                    job = submit('expand_series', event_id=new_event.id)
+                    if job.status == 'done':
+                        flash(f"Termin erfolgreich hinzugefügt ({job.result['created']} Wiederholungen angelegt)", 'success')
+                    elif job.status == 'failed':
+                        flash(f'Termin hinzugefügt, Wiederholungen konnten nicht angelegt werden: {job.error}', 'danger')
+                    else:
+                        flash('Termin erfolgreich hinzugefügt, die Wiederholungen werden im Hintergrund angelegt', 'success')
+                else:
+                    flash('Termin erfolgreich hinzugefügt', 'success')
+                events_cache.invalidate(*event_span(new_event))
                 return redirect(url_for('index'))
             except ValueError as e:
                 logging.error(f"Error adding event: {str(e)}")
@@ -173,11 +303,86 @@ def init_routes(app):
         
         return render_template('add_event.html')
 
+    @app.route('/import_events', methods=['GET', 'POST'])
+    @login_required
+    def import_events():
+        job = None
+        if request.method == 'POST':
+            upload = request.files.get('file')
+            try:
+                if not upload or not upload.filename:
+                    raise ValueError('Bitte eine CSV- oder ICS-Datei auswählen')
+                import_format = detect_format(upload.filename, request.form.get('format'))
+                job = submit('import_events', path=save_upload(upload, import_format), import_format=import_format,
+                             filename=upload.filename, dry_run='dry_run' in request.form)
+            except ValueError as e:
+                logging.error(f"Error importing events: {str(e)}")
+                if request.accept_mimetypes.best == 'application/json':
+                    return jsonify({'error': str(e)}), 400
+                flash(f'Fehler beim Import: {str(e)}', 'danger')
+        elif request.args.get('job', type=int):
+            job = Job.query.get_or_404(request.args.get('job', type=int))
+
+        if job is not None and request.accept_mimetypes.best == 'application/json':
+            if job.status == 'done':
+                return jsonify(job.result)
+            if job.status == 'failed':
+                return jsonify({'error': job.error}), 400
+            response = jsonify(job.to_dict())
+            response.headers['Location'] = url_for('job_status', job_id=job.id)
+            return response, 202
+        if job is not None and request.method == 'POST' and job.status in ('queued', 'running'):
+            # The page polls /jobs/<id> and reloads once the worker is done
+            return redirect(url_for('import_events', job=job.id))
+        return render_template('import_events.html', job=job,
+                               report=job.result if job is not None and job.status == 'done' else None)
+
+    @app.route('/jobs/<int:job_id>')
+    @login_required
+    def job_status(job_id):
+        return jsonify(Job.query.get_or_404(job_id).to_dict())
+
     @app.route('/manage_events')
     @login_required
     def manage_events():
-        events = Event.query.all()
-        return render_template('manage_events.html', events=events)
+        filters = {
+            'start_date': request.args.get('start_date', ''),
+            'end_date': request.args.get('end_date', ''),
+            'category': request.args.get('category', ''),
+            'q': request.args.get('q', '').strip(),
+        }
+        page_size = min(request.args.get('per_page', app.config['MANAGE_EVENTS_PAGE_SIZE'], type=int), 200)
+        page_size = max(page_size, 1)
+
+        query = Event.query
+        try:
+            if filters['start_date']:
+                query = query.filter(Event.date >= datetime.strptime(filters['start_date'], '%Y-%m-%d').date())
+            if filters['end_date']:
+                query = query.filter(Event.date <= datetime.strptime(filters['end_date'], '%Y-%m-%d').date())
+            # Keyset cursor "<date>:<id>" of the last row on the previous page
+            after = request.args.get('after')
+            if after:
+                after_date, after_id = after.split(':')
+                query = query.filter(db.tuple_(Event.date, Event.id) > (
+                    datetime.strptime(after_date, '%Y-%m-%d').date(), int(after_id)))
+        except ValueError:
+            flash('Ungültiger Filter', 'danger')
+            return redirect(url_for('manage_events'))
+        if filters['category']:
+            query = query.filter(Event.category == filters['category'])
+        if filters['q']:
+            query = query.filter(Event.name.startswith(filters['q'], autoescape=True))
+
+        events = query.order_by(Event.date, Event.id).limit(page_size + 1).all()
+        next_cursor = None
+        if len(events) > page_size:
+            events = events[:page_size]
+            next_cursor = f'{events[-1].date.isoformat()}:{events[-1].id}'
+        active_filters = {key: value for key, value in filters.items() if value}
+        return render_template('manage_events.html', events=events, filters=filters,
+                               active_filters=active_filters, next_cursor=next_cursor,
+                               is_first_page=not request.args.get('after'))
 
     @app.route('/events')
     def get_events():
@@ -190,39 +395,168 @@ def init_routes(app):
         start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
         end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
         
-        events = Event.query.filter(Event.date.between(start_date, end_date)).all()
-        events_dict = {}
-        
-        for event in events:
-            event_date = event.date.isoformat()
-            if event_date not in events_dict:
-                events_dict[event_date] = []
-            events_dict[event_date].append(event.to_dict())
+        window_format, encoding = negotiate(request.accept_mimetypes, request.accept_encodings)
+
+        def build_window():
+            return compress(encode_window(load_window(start_date, end_date), window_format), encoding)
         
-        return jsonify(events_dict)
+        # Compressed variants are cached as such and never recompressed
+        etag, body = fetch_window(start_date, end_date, build_window, cache_variant(window_format, encoding))
+        return window_response(app, etag, body, window_format, encoding)
+
+    @app.route('/events/months')
+    def get_event_months():
+        try:
+            first_month = datetime.strptime(request.args.get('start', ''), '%Y-%m').date()
+            count = int(request.args.get('count', 3))
+        except ValueError:
+            return jsonify({'error': 'start (JJJJ-MM) ist erforderlich'}), 400
+        if not 1 <= count <= app.config['EVENTS_MAX_MONTHS']:
+            return jsonify({'error': f"count muss zwischen 1 und {app.config['EVENTS_MAX_MONTHS']} liegen"}), 400
+
+        window_format, encoding = negotiate(request.accept_mimetypes, request.accept_encodings)
+        months = [add_months(first_month, offset) for offset in range(count)]
+        month_ends = [add_months(month, 1) - timedelta(days=1) for month in months]
+        loaded = {}
+
+        # Each month is cached under the same window as a single-month /events call.
+        # The first miss loads the whole range in one go and the other misses reuse it.
+        def build_month(month_start, month_end):
+            if not loaded:
+                loaded['occurrences'] = load_window(months[0], month_ends[-1])
+            return encode_window(
+                (occurrence for occurrence in loaded['occurrences'] if month_start <= occurrence[0] <= month_end),
+                window_format)
+
+        def build_months():
+            parts = []
+            for month_start, month_end in zip(months, month_ends):
+                body = events_cache.fetch(month_start, month_end, lambda: build_month(month_start, month_end),
+                                          variant=window_format, version=request_version())
+                parts.append(b'"' + month_start.strftime('%Y-%m').encode() + b'":' + body.rstrip())
+            return compress(b'{' + b','.join(parts) + b'}\n', encoding)
+
+        etag, body = fetch_window(months[0], month_ends[-1], build_months,
+                                  'months:' + cache_variant(window_format, encoding))
+        return window_response(app, etag, body, window_format, encoding)
+
+    @app.route('/events/summary')
+    def get_event_summary():
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+
+        try:
+            start_date = datetime.strptime(start_date or '', '%Y-%m-%d').date()
+            end_date = datetime.strptime(end_date or '', '%Y-%m-%d').date()
+        except ValueError:
+            # Same answer as the async embed API for missing and malformed dates
+            return jsonify({'error': 'start_date und end_date sind erforderlich'}), 400
+        _, encoding = negotiate(request.accept_mimetypes, request.accept_encodings)
+
+        # Per-day counts by category for year and heatmap views, a fraction of the full window
+        def build_summary():
+            return compress(encode_summary(load_summary(start_date, end_date)), encoding)
+
+        etag, body = fetch_window(start_date, end_date, build_summary, 'summary:' + cache_variant('json', encoding))
+        return window_response(app, etag, body, 'json', encoding)
+
+    @app.route('/events/export')
+    def export_events():
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        export_format = request.args.get('format', 'json')
+
+        try:
+            start_date = datetime.strptime(start_date or '', '%Y-%m-%d').date()
+            end_date = datetime.strptime(end_date or '', '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({'error': 'start_date und end_date sind erforderlich'}), 400
+        if export_format not in ('json', 'ndjson'):
+            return jsonify({'error': 'format muss json oder ndjson sein'}), 400
+
+        # Rows are written as they arrive from the cursor, memory stays flat for any range
+        def generate_ndjson():
+            for occurrence_date, event in iter_events_in_window(start_date, end_date):
+                yield app.json.dumps(event.to_dict(occurrence_date)) + '\n'
+
+        def generate_json():
+            yield '{'
+            for index, (occurrence_date, occurrences) in enumerate(
+                    groupby(iter_events_in_window(start_date, end_date), key=lambda occurrence: occurrence[0])):
+                separator = ',' if index else ''
+                yield f'{separator}"{occurrence_date.isoformat()}":['
+                yield ','.join(app.json.dumps(event.to_dict(occurrence_date)) for _, event in occurrences)
+                yield ']'
+            yield '}\n'
+
+        if export_format == 'ndjson':
+            return app.response_class(stream_with_context(generate_ndjson()), mimetype='application/x-ndjson')
+        return app.response_class(stream_with_context(generate_json()), mimetype='application/json')
+
+    @app.route('/events.ics')
+    def events_ics():
+        etag, body = fetch_window(*feed_window(), lambda: build_calendar(request.host), f'ics:{request.host}')
+        response = app.response_class(body, mimetype='text/calendar')
+        response.set_etag(etag)
+        set_cache_policy(response, app.config['EVENTS_MAX_AGE'])
+        return response.make_conditional(request)
+
+    @app.route('/cache_stats')
+    @login_required
+    def cache_stats():
+        return jsonify(dict(events_cache.stats(), users=user_cache.stats()))
 
     @app.route('/bulk_delete_events', methods=['POST'])
     @login_required
     def bulk_delete_events():
-        event_ids = request.form.getlist('event_ids')
-        for event_id in event_ids:
-            event = Event.query.get(event_id)
-            if event:
-                db.session.delete(event)
-        db.session.commit()
-        flash('Ausgewählte Termine wurden gelöscht', 'success')
+        event_ids = [int(event_id) for event_id in request.form.getlist('event_ids') if event_id.isdigit()]
+        job = submit('delete_events', event_ids=event_ids) if event_ids else None
+        if job is not None and job.status == 'failed':
+            flash(f'Fehler beim Löschen: {job.error}', 'danger')
+        elif job is not None and job.status != 'done':
+            flash('Ausgewählte Termine werden im Hintergrund gelöscht', 'success')
+        else:
+            flash('Ausgewählte Termine wurden gelöscht', 'success')
         return redirect(url_for('manage_events'))
 
+    @app.route('/delete_series/<int:event_id>', methods=['POST'])
+    @login_required
+    def delete_series(event_id):
+        event = Event.query.get_or_404(event_id)
+        master = db.session.get(Event, event.series_id) if event.series_id else event
+        if master is None:
+            # The master is gone but SQLite did not apply ON DELETE SET NULL, the occurrences still share its id
+            series = Event.series_id == event.series_id
+            span = tuple(db.session.execute(db.select(db.func.min(Event.date), db.func.max(Event.date)).where(series)).one())
+        else:
+            series = db.or_(Event.id == master.id, Event.series_id == master.id)
+            span = event_span(master)
+        # Master and all materialized occurrences go in one statement
+        unindex_events(db.select(Event.id).where(series))
+        result = db.session.execute(
+            db.delete(Event).where(series),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+        events_cache.invalidate(*span)
+        flash(f'Terminserie gelöscht ({result.rowcount} Termine)', 'success')
+        return jsonify({'success': True, 'deleted': result.rowcount}), 200
+
     @app.route('/edit_event/<int:event_id>', methods=['GET', 'POST'])
     @login_required
     def edit_event(event_id):
         event = Event.query.get_or_404(event_id)
         if request.method == 'POST':
+            old_span = event_span(event)
             event.name = request.form['name']
             event.date = datetime.strptime(request.form['date'], '%Y-%m-%d').date()
             event.time = datetime.strptime(request.form['time'], '%H:%M').time()
             event.category = request.form.get('category', 'default')
+            db.session.flush()
+            index_events([event])
             db.session.commit()
+            events_cache.invalidate(*old_span)
+            events_cache.invalidate(*event_span(event))
             flash('Termin erfolgreich aktualisiert', 'success')
             return redirect(url_for('manage_events'))
         return render_template('edit_event.html', event=event)
@@ -242,7 +576,10 @@ def init_routes(app):
             category=event.category
         )
         db.session.add(new_event)
+        db.session.flush()
+        index_events([new_event])
         db.session.commit()
+        events_cache.invalidate(*event_span(new_event))
         flash('Termin erfolgreich dupliziert', 'success')
         return jsonify({'success': True}), 200
 
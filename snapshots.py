@@ -0,0 +1,161 @@
+"""Pre-rendered month pages for the embed widget.
+
+With EMBED_SNAPSHOTS on, every month from EMBED_SNAPSHOT_MONTHS_BACK months ago
+to EMBED_SNAPSHOT_MONTHS months ahead is written to EMBED_SNAPSHOT_DIR as a
+complete HTML page, events included. The pages need no JavaScript and no /events
+request, a web server can hand them out as plain files. The events_cache
+invalidations of a request are merged into one render_snapshots job for the
+months they touched, submitted once the response has been sent.
+"""
+import calendar
+import os
+import tempfile
+from datetime import date, timedelta
+from itertools import groupby
+from flask import after_this_request, current_app, g, has_request_context, render_template, url_for
+from cache import events_cache
+from jobs import job_handler, submit
+from occurrence_index import indexed_events_in_window
+from recurrence import add_months, events_in_window
+
+GERMAN_MONTHS = ['Januar', 'Februar', 'März', 'April', 'Mai', 'Juni', 'Juli', 'August', 'September', 'Oktober',
+                 'November', 'Dezember']
+# Same column order as the JavaScript calendars, weeks start on Sunday
+GERMAN_DAYS = ['So', 'Mo', 'Di', 'Mi', 'Do', 'Fr', 'Sa']
+
+
+def month_name(month):
+    """The month's file and URL name, e.g. '2024-02'."""
+    return month.strftime('%Y-%m')
+
+
+def snapshot_range(today=None):
+    """First days of the first and last month that get a snapshot."""
+    config = current_app.config
+    current = (today or date.today()).replace(day=1)
+    return (add_months(current, -config['EMBED_SNAPSHOT_MONTHS_BACK']),
+            add_months(current, config['EMBED_SNAPSHOT_MONTHS'] - 1))
+
+
+def month_end(month):
+    return add_months(month, 1) - timedelta(days=1)
+
+
+def render_month(month, occurrences, first, last):
+    events = {day: [event for _, event in group] for day, group in groupby(occurrences, key=lambda item: item[0])}
+    previous_month, next_month = add_months(month, -1), add_months(month, 1)
+    # url_for needs a request, jobs render outside of one
+    with current_app.test_request_context(f'/embed/snapshot/{month_name(month)}'):
+        return render_template(
+            'embed_snapshot.html',
+            title=f'{GERMAN_MONTHS[month.month - 1]} {month.year}',
+            days=GERMAN_DAYS,
+            weeks=calendar.Calendar(firstweekday=6).monthdatescalendar(month.year, month.month),
+            month=month,
+            events=events,
+            previous_url=url_for('embed_snapshot', name=month_name(previous_month)) if previous_month >= first else None,
+            next_url=url_for('embed_snapshot', name=month_name(next_month)) if next_month <= last else None,
+        )
+
+
+def write_snapshot(directory, name, body):
+    # Readers only ever see a complete file
+    handle, path = tempfile.mkstemp(suffix='.tmp', dir=directory)
+    with os.fdopen(handle, 'w', encoding='utf-8') as snapshot:
+        snapshot.write(body)
+    os.chmod(path, 0o644)
+    os.replace(path, os.path.join(directory, name))
+
+
+def render_snapshots(start_date=None, end_date=None):
+    """Rewrite the snapshots of all months in range that overlap [start_date, end_date], returns their names."""
+    first, last = snapshot_range()
+    lower = max(first, start_date.replace(day=1)) if start_date else first
+    upper = min(last, end_date.replace(day=1)) if end_date else last
+    if lower > upper:
+        return []
+
+    load_window = indexed_events_in_window if current_app.config['OCCURRENCE_INDEX'] else events_in_window
+    # One window query for all months, split up by month afterwards
+    by_month = {
+        key: list(group)
+        for key, group in groupby(load_window(lower, month_end(upper)), key=lambda item: (item[0].year, item[0].month))
+    }
+    directory = current_app.config['EMBED_SNAPSHOT_DIR']
+    os.makedirs(directory, exist_ok=True)
+    current, written, month = date.today().replace(day=1), [], lower
+    while month <= upper:
+        body = render_month(month, by_month.get((month.year, month.month), []), first, last)
+        write_snapshot(directory, f'{month_name(month)}.html', body)
+        # Lets a web server answer /embed/snapshot/current without the app
+        if month == current:
+            write_snapshot(directory, 'current.html', body)
+        written.append(month_name(month))
+        month = add_months(month, 1)
+    return written
+
+
+def prune_snapshots():
+    """Delete snapshots of months that left the range, returns their names."""
+    first, last = snapshot_range()
+    directory = current_app.config['EMBED_SNAPSHOT_DIR']
+    keep = set()
+    month = first
+    while month <= last:
+        keep.add(f'{month_name(month)}.html')
+        month = add_months(month, 1)
+    removed = []
+    for name in sorted(os.listdir(directory)) if os.path.isdir(directory) else ():
+        if name.endswith('.html') and name != 'current.html' and name not in keep:
+            os.remove(os.path.join(directory, name))
+            removed.append(name[:-len('.html')])
+    return removed
+
+
+@job_handler('render_snapshots')
+def render_snapshots_job(start_date, end_date):
+    return {'months': render_snapshots(date.fromisoformat(start_date), date.fromisoformat(end_date))}
+
+
+class EmbedSnapshots:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['embed_snapshots'] = self
+        events_cache.on_invalidate(self.refresh)
+
+    def refresh(self, start_date, end_date):
+        if not current_app.config['EMBED_SNAPSHOTS']:
+            return
+        first, last = snapshot_range()
+        if start_date > month_end(last) or end_date < first:
+            return
+        if not has_request_context():
+            # Jobs and CLI commands have no response to wait for
+            self.submit(start_date, end_date)
+            return
+        pending = g.get('snapshot_span')
+        if pending is None:
+            after_this_request(self.defer)
+        else:
+            start_date, end_date = min(start_date, pending[0]), max(end_date, pending[1])
+        g.snapshot_span = (start_date, end_date)
+
+    def defer(self, response):
+        # Rendering up to a year of months must not hold up the admin's redirect
+        app, (start_date, end_date) = current_app._get_current_object(), g.pop('snapshot_span')
+
+        def submit_after_response():
+            with app.app_context():
+                self.submit(start_date, end_date)
+
+        response.call_on_close(submit_after_response)
+        return response
+
+    def submit(self, start_date, end_date):
+        submit('render_snapshots', start_date=start_date.isoformat(), end_date=end_date.isoformat())
+
+
+embed_snapshots = EmbedSnapshots()
@@ -21,18 +21,24 @@ document.addEventListener('DOMContentLoaded', function() {
     const germanDays = ['So', 'Mo', 'Di', 'Mi', 'Do', 'Fr', 'Sa'];
     const germanMonths = ['Januar', 'Februar', 'März', 'April', 'Mai', 'Juni', 'Juli', 'August', 'September', 'Oktober', 'November', 'Dezember'];
     
-    function createMonthElement(date) {
+    function createMonthElement(date, withNavigation = true) {
         console.log(`Child Calendar: Creating month element for ${germanMonths[dateFns.getMonth(date)]} ${dateFns.getYear(date)}`);
         const monthEl = document.createElement('div');
-        monthEl.classList.add('col-12', 'mb-4', 'position-relative');
+        if (withNavigation) {
+            monthEl.classList.add('col-12', 'mb-4', 'position-relative');
+        } else {
+            monthEl.classList.add('col-md-4', 'col-lg-3', 'mb-3', 'year-month');
+        }
         
         const monthName = `${germanMonths[dateFns.getMonth(date)]} ${dateFns.getYear(date)}`;
-        monthEl.innerHTML = `
+        const header = withNavigation ? `
             <div class="d-flex justify-content-between align-items-center mb-2">
                 <button id="prevPeriod" class="btn btn-sm btn-outline-secondary">&lt;</button>
                 <h3>${monthName}</h3>
                 <button id="nextPeriod" class="btn btn-sm btn-outline-secondary">&gt;</button>
-            </div>
+            </div>` : `
+            <h5 class="text-center">${germanMonths[dateFns.getMonth(date)]}</h5>`;
+        monthEl.innerHTML = `${header}
             <table class="table table-bordered">
                 <thead>
                     <tr>
@@ -74,27 +80,53 @@ document.addEventListener('DOMContentLoaded', function() {
         return monthEl;
     }
     
+    function createYearHeader(date) {
+        const headerEl = document.createElement('div');
+        headerEl.classList.add('col-12', 'mb-3', 'position-relative');
+        headerEl.innerHTML = `
+            <div class="d-flex justify-content-between align-items-center">
+                <button id="prevPeriod" class="btn btn-sm btn-outline-secondary">&lt;</button>
+                <h3>${dateFns.getYear(date)}</h3>
+                <button id="nextPeriod" class="btn btn-sm btn-outline-secondary">&gt;</button>
+            </div>
+        `;
+        return headerEl;
+    }
+    
     function updateCalendar() {
         console.log('Child Calendar: Updating calendar');
         showLoading();
         calendarEl.innerHTML = '';
         
         try {
-            const monthElement = createMonthElement(currentDate);
-            calendarEl.appendChild(monthElement);
-            const startDate = dateFns.startOfMonth(currentDate);
-            const endDate = dateFns.endOfMonth(currentDate);
-            
-            console.log('Child Calendar: Fetching events for:', startDate, 'to', endDate);
-            fetchAndDisplayEvents(startDate, endDate);
+            const step = currentView === 'year' ? 12 : 1;
+            if (currentView === 'year') {
+                calendarEl.appendChild(createYearHeader(currentDate));
+                const startDate = dateFns.startOfYear(currentDate);
+                const endDate = dateFns.endOfYear(currentDate);
+                for (let month = 0; month < 12; month++) {
+                    calendarEl.appendChild(createMonthElement(dateFns.addMonths(startDate, month), false));
+                }
+                
+                console.log('Child Calendar: Fetching year summary for:', startDate, 'to', endDate);
+                fetchAndDisplaySummary(startDate, endDate);
+            } else {
+                const monthElement = createMonthElement(currentDate);
+                calendarEl.appendChild(monthElement);
+                const startDate = dateFns.startOfMonth(currentDate);
+                const endDate = dateFns.endOfMonth(currentDate);
+                
+                console.log('Child Calendar: Fetching events for:', startDate, 'to', endDate);
+                fetchAndDisplayEvents(startDate, endDate);
+            }
 
             document.getElementById('prevPeriod').addEventListener('click', () => {
-                currentDate = dateFns.subMonths(currentDate, 1);
+                currentDate = dateFns.subMonths(currentDate, step);
                 updateCalendar();
             });
             
             document.getElementById('nextPeriod').addEventListener('click', () => {
-                currentDate = dateFns.addMonths(currentDate, 1);
+                currentDate = dateFns.addMonths(currentDate, step);
                 updateCalendar();
             });
         } catch (error) {
@@ -103,10 +135,44 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
-    function fetchAndDisplayEvents(startDate, endDate) {
-        console.log('Child Calendar: Fetching events');
+    // Month cache ('yyyy-MM' -> events by date) for the whole session
+    const monthCache = {};
+    const pendingMonths = {};
+    const PREFETCH_MONTHS = 1;
+    const COMPACT_MIMETYPE = 'application/vnd.kalender.compact+json';
+    
+    function monthKey(date) {
+        return dateFns.format(date, 'yyyy-MM');
+    }
+    
+    // Turn the server's columnar format (lookup tables plus one list per field) into events by date
+    function expandCompactWindow(window) {
+        const eventsByDate = {};
+        window.date.forEach((dateIndex, i) => {
+            const day = window.dates[dateIndex];
+            (eventsByDate[day] = eventsByDate[day] || []).push({
+                name: window.names[window.name[i]],
+                time: window.times[window.time[i]],
+                category: window.categories[window.category[i]],
+                is_recurring: window.recurring[i] === 1
+            });
+        });
+        return eventsByDate;
+    }
+    
+    function fetchMonths(firstMonth, count) {
+        const keys = [];
+        for (let i = 0; i < count; i++) {
+            keys.push(monthKey(dateFns.addMonths(firstMonth, i)));
+        }
+        if (keys.every(key => monthCache[key] || pendingMonths[key])) {
+            return Promise.all(keys.map(key => pendingMonths[key]));
+        }
         
-        fetch(`/events?start_date=${dateFns.format(startDate, 'yyyy-MM-dd')}&end_date=${dateFns.format(endDate, 'yyyy-MM-dd')}`)
+        console.log('Child Calendar: Fetching months', keys.join(', '));
+        const request = fetch(`/events/months?start=${keys[0]}&count=${count}`, {
+            headers: { 'Accept': COMPACT_MIMETYPE }
+        })
             .then(response => {
                 console.log('Child Calendar: Fetch response status:', response.status);
                 if (!response.ok) {
@@ -114,18 +180,126 @@ document.addEventListener('DOMContentLoaded', function() {
                 }
                 return response.json();
             })
-            .then(fetchedEvents => {
-                console.log(`Child Calendar: Received events for ${Object.keys(fetchedEvents).length} dates`);
-                events = fetchedEvents;
-                displayEvents();
-                hideLoading();
+            .then(fetchedMonths => {
+                Object.keys(fetchedMonths).forEach(key => {
+                    monthCache[key] = expandCompactWindow(fetchedMonths[key]);
+                });
             })
+            .finally(() => {
+                keys.forEach(key => delete pendingMonths[key]);
+            });
+        keys.forEach(key => {
+            if (!pendingMonths[key]) {
+                pendingMonths[key] = request;
+            }
+        });
+        return request;
+    }
+    
+    function prefetchNeighbors(date) {
+        const next = dateFns.addMonths(date, 1);
+        const previous = dateFns.subMonths(date, 1);
+        if (!monthCache[monthKey(next)]) {
+            fetchMonths(next, PREFETCH_MONTHS * 2 + 1).catch(error => console.error('Child Calendar: Prefetch failed:', error));
+        }
+        if (!monthCache[monthKey(previous)]) {
+            fetchMonths(dateFns.subMonths(date, PREFETCH_MONTHS * 2 + 1), PREFETCH_MONTHS * 2 + 1)
+                .catch(error => console.error('Child Calendar: Prefetch failed:', error));
+        }
+    }
+    
+    function fetchAndDisplayEvents(startDate, endDate) {
+        const key = monthKey(startDate);
+        
+        const show = () => {
+            // The user may have navigated on while the request was in flight
+            if (currentView === 'year' || monthKey(currentDate) !== key) {
+                return;
+            }
+            events = monthCache[key] || {};
+            console.log(`Child Calendar: Received events for ${Object.keys(events).length} dates`);
+            displayEvents();
+            hideLoading();
+            prefetchNeighbors(startDate);
+        };
+        
+        if (monthCache[key]) {
+            show();
+            return;
+        }
+        
+        fetchMonths(dateFns.subMonths(startDate, PREFETCH_MONTHS), PREFETCH_MONTHS * 2 + 1)
+            .then(show)
             .catch(error => {
                 console.error('Child Calendar: Error fetching events:', error);
                 showError('Unable to load events. Please try refreshing the page.');
             });
     }
     
+    // Year overview ('yyyy' -> counts per category and day) from /events/summary
+    const summaryCache = {};
+    
+    function fetchAndDisplaySummary(startDate, endDate) {
+        const key = dateFns.format(startDate, 'yyyy');
+        
+        const show = () => {
+            if (currentView !== 'year' || dateFns.format(currentDate, 'yyyy') !== key) {
+                return;
+            }
+            displaySummary(summaryCache[key]);
+            hideLoading();
+        };
+        
+        if (summaryCache[key]) {
+            show();
+            return;
+        }
+        
+        fetch(`/events/summary?start_date=${dateFns.format(startDate, 'yyyy-MM-dd')}&end_date=${dateFns.format(endDate, 'yyyy-MM-dd')}`)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`HTTP error! status: ${response.status}`);
+                }
+                return response.json();
+            })
+            .then(summary => {
+                summaryCache[key] = summary;
+                show();
+            })
+            .catch(error => {
+                console.error('Child Calendar: Error fetching year summary:', error);
+                showError('Unable to load the year overview. Please try refreshing the page.');
+            });
+    }
+    
+    function displaySummary(summary) {
+        console.log('Child Calendar: Displaying year summary');
+        Object.keys(summary).forEach(date => {
+            const day = summary[date];
+            const categories = Object.keys(day.categories);
+            const total = categories.reduce((sum, category) => sum + day.categories[category], 0);
+            const mainCategory = categories.reduce((best, category) => day.categories[category] > day.categories[best] ? category : best);
+            document.querySelectorAll(`td[data-date="${date}"]`).forEach(cell => {
+                cell.classList.add('event-category-' + mainCategory);
+                cell.style.cursor = 'pointer';
+                if (total > 1) {
+                    cell.classList.add('multiple-events');
+                }
+                if (day.recurring) {
+                    cell.classList.add('recurring-event');
+                }
+                cell.title = `${total} Termin${total === 1 ? '' : 'e'}`;
+                // Clicking a day opens its month with all events
+                cell.addEventListener('click', () => {
+                    const [year, month, dayOfMonth] = date.split('-').map(Number);
+                    currentDate = new Date(year, month - 1, dayOfMonth);
+                    currentView = 'month';
+                    updateCalendar();
+                });
+            });
+        });
+    }
+    
     function displayEvents() {
         console.log('Child Calendar: Displaying events');
         Object.keys(events).forEach(date => {
@@ -0,0 +1,48 @@
+from datetime import date, time
+from ical import event_lines, fold_line
+from importer import unfold
+from models import Event
+
+
+def physical_lines(folded):
+    return folded.split('\r\n')
+
+
+def test_short_lines_are_not_folded():
+    line = 'SUMMARY:' + 'x' * 67
+    assert fold_line(line) == line
+
+
+def test_long_lines_fold_at_75_octets():
+    line = 'SUMMARY:' + 'x' * 200
+    parts = physical_lines(fold_line(line))
+    assert len(parts) == 3
+    assert all(len(part.encode('utf-8')) <= 75 for part in parts)
+    assert all(part.startswith(' ') for part in parts[1:])
+
+
+def test_folding_never_splits_a_multibyte_character():
+    line = 'SUMMARY:' + 'ä' * 60 + '€' * 30
+    parts = physical_lines(fold_line(line))
+    assert all(len(part.encode('utf-8')) <= 75 for part in parts)
+    # Every part decodes on its own, so no character was cut in half
+    assert ''.join([parts[0]] + [part[1:] for part in parts[1:]]) == line
+
+
+def test_folded_lines_unfold_to_the_original():
+    lines = ['BEGIN:VEVENT', 'SUMMARY:' + 'Öffentliche Führung durch die Ausstellung ' * 4, 'END:VEVENT']
+    text = '\r\n'.join(fold_line(line) for line in lines) + '\r\n'
+    assert [line for _, line in unfold(text.splitlines(keepends=True))] == lines
+
+
+def test_virtual_series_gets_an_rrule():
+    event = Event(id=1, name='Serie', date=date(2024, 1, 31), time=time(9), is_recurring=True,
+                  recurrence_type='monthly', recurrence_end_date=date(2024, 6, 30), recurrence_materialized=False)
+    assert 'RRULE:FREQ=MONTHLY;BYMONTHDAY=28,29,30,31;BYSETPOS=-1;UNTIL=20240630T090000' in event_lines(event, 'host')
+
+
+def test_materialized_series_master_has_no_rrule():
+    # Its occurrences are rows of their own and exported as separate VEVENTs
+    event = Event(id=1, name='Serie', date=date(2024, 1, 31), time=time(9), is_recurring=True,
+                  recurrence_type='monthly', recurrence_end_date=date(2024, 6, 30), recurrence_materialized=True)
+    assert not [line for line in event_lines(event, 'host') if line.startswith(('RRULE', 'RDATE'))]
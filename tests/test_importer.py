@@ -0,0 +1,101 @@
+import io
+from datetime import date, time
+import pytest
+from sqlalchemy import event
+from app import create_app
+from importer import import_rows, read_rows
+from models import db, Event
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'calendar.db'}")
+    monkeypatch.setenv('EVENTS_CACHE', 'none')
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def csv_rows(*lines):
+    text = 'name,date,time,category\n' + ''.join(line + '\n' for line in lines)
+    return read_rows(io.BytesIO(text.encode('utf-8')), 'csv')
+
+
+def ics_rows(*events):
+    body = ''.join(f'BEGIN:VEVENT\r\n{event}END:VEVENT\r\n' for event in events)
+    return read_rows(io.BytesIO(f'BEGIN:VCALENDAR\r\n{body}END:VCALENDAR\r\n'.encode('utf-8')), 'ics')
+
+
+def stored():
+    return [(event.name, event.date, event.time) for event in Event.query.order_by(Event.date, Event.time)]
+
+
+def test_duplicates_within_a_file_are_imported_once(app):
+    report = import_rows(csv_rows('Chor,2024-03-01,19:00,music', 'Chor,2024-03-01,19:00,music',
+                                  'Chor,01.03.2024,19:00:00,music'))
+    assert (report['imported'], report['duplicates'], report['errors']) == (1, 2, [])
+    assert stored() == [('Chor', date(2024, 3, 1), time(19))]
+
+
+def test_duplicates_are_found_across_batches(app):
+    report = import_rows(csv_rows('A,2024-03-01,19:00,x', 'B,2024-03-02,19:00,x', 'A,2024-03-01,19:00,x'),
+                         batch_size=2)
+    # The second batch holds only the duplicate and writes nothing
+    assert (report['imported'], report['duplicates'], report['batches']) == (2, 1, 1)
+
+
+def test_reimporting_a_file_skips_stored_events(app):
+    lines = ('Chor,2024-03-01,19:00,music', 'Chor,2024-03-08,19:00,music')
+    import_rows(csv_rows(*lines))
+    report = import_rows(csv_rows(*lines, 'Chor,2024-03-08,20:00,music'))
+    assert (report['imported'], report['duplicates']) == (1, 2)
+    assert len(stored()) == 3
+
+
+def test_dry_run_reports_without_writing(app):
+    report = import_rows(csv_rows('A,2024-03-01,19:00,x', 'A,2024-03-01,19:00,x', 'B,kein Datum,19:00,x'),
+                         dry_run=True)
+    assert (report['imported'], report['duplicates']) == (1, 1)
+    assert report['errors'] == [{'line': 4, 'error': "date: ungültiges Datum 'kein Datum'"}]
+    assert stored() == []
+
+
+def test_utc_times_are_converted_to_the_calendar_zone(app):
+    # Berlin is UTC+1 in winter and UTC+2 in summer
+    report = import_rows(ics_rows('SUMMARY:Winter\r\nDTSTART:20240131T233000Z\r\n',
+                                  'SUMMARY:Sommer\r\nDTSTART:20240701T070000Z\r\n'), timezone='Europe/Berlin')
+    assert report['errors'] == []
+    assert stored() == [('Winter', date(2024, 2, 1), time(0, 30)), ('Sommer', date(2024, 7, 1), time(9))]
+
+
+def test_tzid_times_are_converted_and_unknown_zones_rejected(app):
+    report = import_rows(ics_rows('SUMMARY:NY\r\nDTSTART;TZID=America/New_York:20240701T090000\r\n',
+                                  'SUMMARY:Mars\r\nDTSTART;TZID=Mars/Olympus:20240701T090000\r\n',
+                                  'SUMMARY:Lokal\r\nDTSTART:20240701T090000\r\n'), timezone='Europe/Berlin')
+    assert report['errors'] == [{'line': 6, 'error': "timezone: unbekannte Zeitzone 'Mars/Olympus'"}]
+    assert stored() == [('Lokal', date(2024, 7, 1), time(9)), ('NY', date(2024, 7, 1), time(15))]
+
+
+def test_converted_times_are_deduplicated_against_local_ones(app):
+    report = import_rows(ics_rows('SUMMARY:Chor\r\nDTSTART:20240701T090000\r\n',
+                                  'SUMMARY:Chor\r\nDTSTART:20240701T070000Z\r\n'), timezone='Europe/Berlin')
+    assert (report['imported'], report['duplicates']) == (1, 1)
+
+
+def test_a_batch_runs_a_fixed_number_of_statements(app):
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        report = import_rows(csv_rows(*(f'Termin {number},2024-03-01,19:00,x' for number in range(200))),
+                             batch_size=200)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    assert report['imported'] == 200
+    # The duplicate check and the INSERT ... RETURNING, no SELECT per imported row. The ETag version bump
+    # after the batch is not part of the import.
+    statements = [statement for statement in statements if 'events_version' not in statement]
+    assert len(statements) == 2
@@ -0,0 +1,64 @@
+from datetime import date, time, timedelta
+from models import Event
+from recurrence import add_months, occurrence_dates
+from recurrence_generator import rule_ordinals
+
+
+def dates(ordinals):
+    return [date.fromordinal(ordinal) for ordinal in ordinals]
+
+
+def series(recurrence_type, first, last):
+    return Event(name='Serie', date=first, time=time(9), is_recurring=True, recurrence_type=recurrence_type,
+                 recurrence_end_date=last)
+
+
+def test_monthly_on_the_31st_clamps_to_the_month_end():
+    assert dates(rule_ordinals('monthly', date(2024, 1, 31), date(2024, 7, 31))) == [
+        date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30),
+        date(2024, 5, 31), date(2024, 6, 30), date(2024, 7, 31),
+    ]
+
+
+def test_monthly_on_the_31st_in_a_window():
+    # The clamped April day is the only one inside the window
+    assert dates(rule_ordinals('monthly', date(2024, 1, 31), date(2024, 12, 31),
+                               date(2024, 4, 1), date(2024, 4, 30))) == [date(2024, 4, 30)]
+    assert dates(rule_ordinals('monthly', date(2024, 1, 31), date(2024, 12, 31),
+                               date(2024, 4, 1), date(2024, 4, 29))) == []
+
+
+def test_yearly_on_february_29th_falls_on_the_28th_in_common_years():
+    assert dates(rule_ordinals('yearly', date(2024, 2, 29), date(2029, 3, 1))) == [
+        date(2024, 2, 29), date(2025, 2, 28), date(2026, 2, 28), date(2027, 2, 28), date(2028, 2, 29),
+        date(2029, 2, 28),
+    ]
+
+
+def test_yearly_on_february_29th_across_a_skipped_leap_year():
+    # 2100 is not a leap year
+    assert dates(rule_ordinals('yearly', date(2096, 2, 29), date(2104, 12, 31))) == [
+        date(2096, 2, 29), date(2097, 2, 28), date(2098, 2, 28), date(2099, 2, 28), date(2100, 2, 28),
+        date(2101, 2, 28), date(2102, 2, 28), date(2103, 2, 28), date(2104, 2, 29),
+    ]
+
+
+def test_weekly_series_keeps_its_weekday_across_daylight_saving_changes():
+    # Europe switches to summer time on 2024-03-31 and back on 2024-10-27, both Sundays
+    event = series('weekly', date(2024, 3, 17), date(2024, 11, 10))
+    days = list(occurrence_dates(event))
+    assert date(2024, 3, 31) in days and date(2024, 10, 27) in days
+    assert {b - a for a, b in zip(days, days[1:])} == {timedelta(weeks=1)}
+    assert {day.weekday() for day in days} == {6}
+
+
+def test_daily_series_has_every_day_around_the_switch_exactly_once():
+    event = series('daily', date(2024, 3, 30), date(2024, 4, 1))
+    assert list(occurrence_dates(event)) == [date(2024, 3, 30), date(2024, 3, 31), date(2024, 4, 1)]
+    assert list(occurrence_dates(event, date(2024, 3, 31), date(2024, 3, 31))) == [date(2024, 3, 31)]
+
+
+def test_monthly_matches_add_months():
+    first = date(2023, 8, 31)
+    expected = [add_months(first, offset) for offset in range(40)]
+    assert dates(rule_ordinals('monthly', first, expected[-1])) == expected
@@ -0,0 +1,67 @@
+import gzip
+import json
+from recurrence import group_by_date
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPACT_MIMETYPE = 'application/vnd.kalender.compact+json'
+WINDOW_MIMETYPES = {'json': 'application/json', 'compact': COMPACT_MIMETYPE}
+CONTENT_CODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compact_window(occurrences):
+    """Columnar layout of a window: one list per field, repeated strings as indexes into lookup tables.
+
+    {"dates": [...], "names": [...], "times": [...], "categories": [...],
+     "date": [0, 0, 1], "name": [...], "time": [...], "category": [...], "recurring": [1, 0, 0]}
+    """
+    tables = {'dates': {}, 'names': {}, 'times': {}, 'categories': {}}
+    columns = {'date': [], 'name': [], 'time': [], 'category': [], 'recurring': []}
+
+    def lookup(table, value):
+        return tables[table].setdefault(value, len(tables[table]))
+
+    for occurrence_date, event in occurrences:
+        columns['date'].append(lookup('dates', occurrence_date.isoformat()))
+        columns['name'].append(lookup('names', event.name))
+        columns['time'].append(lookup('times', event.time.isoformat()))
+        columns['category'].append(lookup('categories', event.category))
+        columns['recurring'].append(1 if event.is_recurring else 0)
+    return dict({table: list(values) for table, values in tables.items()}, **columns)
+
+
+def encode_window(occurrences, window_format='json'):
+    if window_format == 'compact':
+        payload = compact_window(occurrences)
+    else:
+        payload = group_by_date(occurrences)
+    # Same bytes as Flask's jsonify outside debug mode
+    return (json.dumps(payload, sort_keys=window_format == 'json', separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def encode_summary(summary):
+    return (json.dumps(summary, sort_keys=True, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def negotiate(accept_mimetypes, accept_encodings):
+    """Return (window format, content coding or None) for the request's Accept headers."""
+    best_mimetype = accept_mimetypes.best_match([WINDOW_MIMETYPES['json'], COMPACT_MIMETYPE])
+    window_format = 'compact' if best_mimetype == COMPACT_MIMETYPE else 'json'
+    return window_format, accept_encodings.best_match(CONTENT_CODINGS)
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=9)
+    if encoding == 'gzip':
+        # A fixed mtime keeps the output, and so the ETag, stable between builds
+        return gzip.compress(body, compresslevel=6, mtime=0)
+    return body
+
+
+def cache_variant(window_format, encoding):
+    # The plain variant shares its entries with single-month windows of /events/months
+    return f'{window_format}+{encoding}' if encoding else window_format